@@ -1,37 +1,38 @@
 from tkinter import *
+from tkinter import filedialog
 from matplotlib.figure import Figure
 from matplotlib.backends.backend_tkagg import (FigureCanvasTkAgg, NavigationToolbar2Tk)
 import math as m
 import numpy as np
 import time
+from orbit_engine import day, nbody_system, solvers
+from orbit_integrators import integrators, make_integrator
+from orbit_sim import simulation, resume
+from orbit_render import blit_renderer
+from orbit_worker import simulation_worker
+from orbit_record import trajectory_reader
+from orbit_collisions import collision_monitor, policies
+from orbit_scenario import read_scenario, save_scenario, system_from_columns, columns_from_system, join_columns, validate_columns, body_columns
+from orbit_table import body_table
+from orbit_profile import profiler
 
-day = 86400
-earth_mass = 5.97219 * (10**24)
 dt = 0
 G = 6.67430 * (10**-11)
 run_time = 0
 scale = 400000
+solver = 'direct'
+theta = 0.5
+integrator = 'euler'
+tol = 1e-9
+render_every = 1
+trail_length = 0
+collision_policy = 'none'
+encounter_distance = 0
 keep_decimals_velocity = 3
 keep_decimals_position = 1
 
 color_map = ['b', 'g', 'r', 'c', 'm', 'y', 'k']
 
-class celestial_body:
-  def __init__(self, mass, posX, posY, velX, velY):
-      self.mass = mass
-      self.pos = np.array([posX, posY])
-      self.vel = np.array([velX, velY])
-  
-  def set_pos(self):
-      self.pos += self.vel * dt
-
-  def set_vel(self, celestial_body):
-      r = np.linalg.norm(self.pos - celestial_body.pos)
-      acc = (G * celestial_body.mass) / (r**2)
-      direction = (celestial_body.pos - self.pos) / r
-      acceleration = acc * direction
-      self.vel += acceleration * dt
-
 class Orbit_GUI:
     def __init__(self, master):
         self.master = master
@@ -44,16 +45,15 @@ class Orbit_GUI:
 
         # create middle frame sub-frames
         self.graph_frame = Frame(self.middle_frame)
-        self.bodies_frame = Frame(self.middle_frame, width=640, padx=5)
+        self.bodies_frame = Frame(self.middle_frame, padx=5)
         self.graph_frame.pack(side=LEFT)
         self.bodies_frame.pack(side=LEFT, fill=Y)
 
-        self.planets_frame = LabelFrame(self.bodies_frame, text='Massive Objects', width=320)
-        self.satellites_frame = LabelFrame(self.bodies_frame, text='Satellites', width=320)
-        self.planets_frame.pack(side=LEFT, fill=Y, padx=(0,5))
-        self.planets_frame.pack_propagate(False)
-        self.satellites_frame.pack(side=LEFT, fill=Y)
-        self.satellites_frame.pack_propagate(False)
+        # the body lists are paged tables over arrays, so only one page of entries ever exists
+        self.planets_frame = LabelFrame(self.bodies_frame, text='Massive Objects')
+        self.satellites_frame = LabelFrame(self.bodies_frame, text='Satellites')
+        self.planets_frame.pack(side=TOP, fill=X, pady=(0,5))
+        self.satellites_frame.pack(side=TOP, fill=X)
 
         # the figure that will contain the plot 
         self.fig = Figure(figsize=(5,5), dpi=100)
@@ -61,6 +61,7 @@ class Orbit_GUI:
         self.canvas = FigureCanvasTkAgg(self.fig, master=self.graph_frame)
         self.canvas.draw()
         self.canvas.get_tk_widget().pack()
+        self.renderer = blit_renderer(self.canvas, self.main_graph)
 
         # create planets and satellites buttons
         self.add_planet_button = Button(self.planets_frame, text='Add Body', command=self.add_celestial_body)
@@ -69,6 +70,10 @@ class Orbit_GUI:
         self.add_satellite_button = Button(self.satellites_frame, text='Add Satellite', command=self.add_satellite)
         self.add_satellite_button.pack()
 
+        decimals = {'x': keep_decimals_position, 'y': keep_decimals_position, 'vx': keep_decimals_velocity, 'vy': keep_decimals_velocity}
+        self.planet_table = body_table(self.planets_frame, ('x', 'y', 'vx', 'vy', 'mass', 'radius'), rows=8, decimals=decimals)
+        self.satellite_table = body_table(self.satellites_frame, ('x', 'y', 'vx', 'vy'), rows=8, decimals=decimals)
+
         # create bottom frame sub-frames
         self.constant_entry_frame = LabelFrame(self.bottom_frame, text='Specs')
         self.control_buttons_frame = Frame(self.bottom_frame)
@@ -100,6 +105,54 @@ class Orbit_GUI:
         self.scale_label.grid(row=3, column=0)
         self.scale_entry.grid(row=3, column=1)
 
+        self.solver_label = Label(self.constant_entry_frame, text='Force Solver: ')
+        self.solver_var = StringVar(value='direct')
+        self.solver_menu = OptionMenu(self.constant_entry_frame, self.solver_var, *solvers)
+        self.solver_label.grid(row=4, column=0)
+        self.solver_menu.grid(row=4, column=1)
+
+        self.theta_label = Label(self.constant_entry_frame, text='Opening Angle: ')
+        self.theta_entry = Entry(self.constant_entry_frame, width=6)
+        self.theta_entry.insert(0,'0.5')
+        self.theta_label.grid(row=5, column=0)
+        self.theta_entry.grid(row=5, column=1)
+
+        self.integrator_label = Label(self.constant_entry_frame, text='Integrator: ')
+        self.integrator_var = StringVar(value='euler')
+        self.integrator_menu = OptionMenu(self.constant_entry_frame, self.integrator_var, *integrators)
+        self.integrator_label.grid(row=6, column=0)
+        self.integrator_menu.grid(row=6, column=1)
+
+        self.tol_label = Label(self.constant_entry_frame, text='Tolerance: ')
+        self.tol_entry = Entry(self.constant_entry_frame, width=6)
+        self.tol_entry.insert(0,'1e-9')
+        self.tol_label.grid(row=7, column=0)
+        self.tol_entry.grid(row=7, column=1)
+
+        self.render_every_label = Label(self.constant_entry_frame, text='Render Every (steps): ')
+        self.render_every_entry = Entry(self.constant_entry_frame, width=6)
+        self.render_every_entry.insert(0,'1')
+        self.render_every_label.grid(row=8, column=0)
+        self.render_every_entry.grid(row=8, column=1)
+
+        self.trail_length_label = Label(self.constant_entry_frame, text='Trail Length (frames): ')
+        self.trail_length_entry = Entry(self.constant_entry_frame, width=6)
+        self.trail_length_entry.insert(0,'0')
+        self.trail_length_label.grid(row=9, column=0)
+        self.trail_length_entry.grid(row=9, column=1)
+
+        self.collision_label = Label(self.constant_entry_frame, text='Collisions: ')
+        self.collision_var = StringVar(value='none')
+        self.collision_menu = OptionMenu(self.constant_entry_frame, self.collision_var, *policies)
+        self.collision_label.grid(row=10, column=0)
+        self.collision_menu.grid(row=10, column=1)
+
+        self.encounter_label = Label(self.constant_entry_frame, text='Encounter Distance (km): ')
+        self.encounter_entry = Entry(self.constant_entry_frame, width=8)
+        self.encounter_entry.insert(0,'0')
+        self.encounter_label.grid(row=11, column=0)
+        self.encounter_entry.grid(row=11, column=1)
+
         # initialize control button frame widgets
         self.update_graph_button = Button(self.control_buttons_frame, text='Update Graph', command=self.update_graph)
         self.update_graph_button.pack(side=LEFT, fill=Y)
@@ -107,263 +160,381 @@ class Orbit_GUI:
         self.simulate_button = Button(self.control_buttons_frame, text='Run Simulation', command=self.run_simulation)
         self.simulate_button.pack(side=LEFT, fill=Y)
 
-        self.step_forward_button = Button(self.control_buttons_frame, text='Step Forward', command=self.step_trajectories)
-        self.step_forward_button.pack(side=LEFT, fill=Y)
-
-        # global variables
-        self.celestial_body_frames = []
-        self.satellite_frames = []
-        self.celestial_bodies = []
-        self.satellite_bodies = []
-
-    def add_celestial_body(self):
-        temp_frame = LabelFrame(self.planets_frame, width=320)
-        temp_frame.pack(side=TOP)
-        temp_frame.pack_propagate(False)
-
-        position_label = Label(temp_frame, text='Position (km):')
-        position_label.grid(row=0, column=0, sticky='w')
-
-        # Position entries
-
-        position_frame = Frame(temp_frame)
-        position_frame.grid(row=1, column=0)
-
-        x_label = Label(position_frame, text='X:')
-        x_pos_entry = Entry(position_frame, width=12)
-        x_label.pack(side=LEFT)
-        x_pos_entry.pack(side=LEFT, padx=5)
-
-        y_label = Label(position_frame, text='Y:')
-        y_pos_entry = Entry(position_frame, width=12)
-        y_label.pack(side=LEFT)
-        y_pos_entry.pack(side=LEFT, padx=5)
-
-        # Velocity entries
+        self.pause_button = Button(self.control_buttons_frame, text='Pause', command=self.toggle_pause, state=DISABLED)
+        self.pause_button.pack(side=LEFT, fill=Y)
 
-        velocity_label = Label(temp_frame, text='Velocity (m/s):')
-        velocity_label.grid(row=2, column=0, sticky='w')
+        self.cancel_button = Button(self.control_buttons_frame, text='Cancel', command=self.cancel_simulation, state=DISABLED)
+        self.cancel_button.pack(side=LEFT, fill=Y)
 
-        velocity_frame = Frame(temp_frame)
-        velocity_frame.grid(row=3, column=0)
+        self.step_forward_button = Button(self.control_buttons_frame, text='Step Forward', command=self.step_trajectories)
+        self.step_forward_button.pack(side=LEFT, fill=Y)
 
-        x_label = Label(velocity_frame, text='X:')
-        x_vel_entry = Entry(velocity_frame, width=12)
-        x_label.pack(side=LEFT)
-        x_vel_entry.pack(side=LEFT, padx=5)
+        self.rate_label = Label(self.control_buttons_frame, text='', width=16)
+        self.rate_label.pack(side=LEFT, fill=Y)
 
-        y_label = Label(velocity_frame, text='Y:')
-        y_vel_entry = Entry(velocity_frame, width=12)
-        y_label.pack(side=LEFT)
-        y_vel_entry.pack(side=LEFT, padx=5)
+        # scenario files go straight between the tables, the simulation arrays and disk
+        self.scenario_frame = LabelFrame(self.bottom_frame, text='Scenario')
+        self.scenario_frame.pack(side=LEFT, padx=5)
 
-        # Mass entries
+        self.load_scenario_button = Button(self.scenario_frame, text='Load Scenario', command=self.load_scenario)
+        self.load_scenario_button.pack(side=TOP, fill=X)
 
-        mass_frame = Frame(temp_frame)
-        mass_frame.grid(row=4, column=0, sticky='w')
+        self.save_scenario_button = Button(self.scenario_frame, text='Save Scenario', command=self.save_scenario)
+        self.save_scenario_button.pack(side=TOP, fill=X)
 
-        mass_label = Label(mass_frame, text='Mass (earth masses):')
-        mass_label.pack(side=LEFT)
+        # profiling widgets, the timings cover the worker's physics and this thread's drawing
+        self.profile_frame = LabelFrame(self.bottom_frame, text='Profiling')
+        self.profile_frame.pack(side=LEFT, padx=5)
 
-        mass_entry = Entry(mass_frame, width=7)
-        mass_entry.pack(side=LEFT, padx=5)
+        self.profile_var = IntVar(value=0)
+        self.profile_check = Checkbutton(self.profile_frame, text='Profile', variable=self.profile_var, command=self.toggle_profiling)
+        self.profile_check.pack(side=TOP, anchor='w')
 
-        self.celestial_body_frames.append(temp_frame)
+        self.overlay_var = IntVar(value=1)
+        self.overlay_check = Checkbutton(self.profile_frame, text='Overlay', variable=self.overlay_var)
+        self.overlay_check.pack(side=TOP, anchor='w')
 
-    def add_satellite(self):
-        temp_frame = LabelFrame(self.satellites_frame, width=320)
-        temp_frame.pack(side=TOP)
-        temp_frame.pack_propagate(False)
+        self.export_trace_button = Button(self.profile_frame, text='Export Trace', command=self.export_trace)
+        self.export_trace_button.pack(side=TOP, fill=X)
 
-        position_label = Label(temp_frame, text='Position (km):')
-        position_label.grid(row=0, column=0, sticky='w')
+        # recording and replay widgets
+        self.recording_frame = LabelFrame(self.bottom_frame, text='Recording')
+        self.recording_frame.pack(side=LEFT, padx=5)
 
-        # Position entries
+        self.record_var = IntVar(value=0)
+        self.record_check = Checkbutton(self.recording_frame, text='Record Run', variable=self.record_var)
+        self.record_check.grid(row=0, column=0, sticky='w')
 
-        position_frame = Frame(temp_frame)
-        position_frame.grid(row=1, column=0)
+        self.record_every_label = Label(self.recording_frame, text='Every (steps): ')
+        self.record_every_entry = Entry(self.recording_frame, width=6)
+        self.record_every_entry.insert(0,'1')
+        self.record_every_label.grid(row=1, column=0)
+        self.record_every_entry.grid(row=1, column=1)
 
-        x_label = Label(position_frame, text='X:')
-        x_pos_entry = Entry(position_frame, width=12)
-        x_label.pack(side=LEFT)
-        x_pos_entry.pack(side=LEFT, padx=5)
+        self.open_recording_button = Button(self.recording_frame, text='Open Recording', command=self.open_recording)
+        self.open_recording_button.grid(row=2, column=0, columnspan=2)
 
-        y_label = Label(position_frame, text='Y:')
-        y_pos_entry = Entry(position_frame, width=12)
-        y_label.pack(side=LEFT)
-        y_pos_entry.pack(side=LEFT, padx=5)
+        self.replay_scale = Scale(self.recording_frame, from_=0, to=0, orient=HORIZONTAL, length=200, label='Frame', command=self.show_recorded_frame)
+        self.replay_scale.grid(row=3, column=0, columnspan=2)
 
-        # Velocity entries
+        # exact checkpoints of a run, written by the worker thread between steps
+        self.checkpoint_var = IntVar(value=0)
+        self.checkpoint_check = Checkbutton(self.recording_frame, text='Checkpoint', variable=self.checkpoint_var)
+        self.checkpoint_check.grid(row=4, column=0, sticky='w')
 
-        velocity_label = Label(temp_frame, text='Velocity (m/s):')
-        velocity_label.grid(row=2, column=0, sticky='w')
+        self.checkpoint_every_label = Label(self.recording_frame, text='Every (steps): ')
+        self.checkpoint_every_entry = Entry(self.recording_frame, width=6)
+        self.checkpoint_every_entry.insert(0,'1000')
+        self.checkpoint_every_label.grid(row=5, column=0)
+        self.checkpoint_every_entry.grid(row=5, column=1)
 
-        velocity_frame = Frame(temp_frame)
-        velocity_frame.grid(row=3, column=0)
+        self.resume_button = Button(self.recording_frame, text='Resume Checkpoint', command=self.resume_checkpoint)
+        self.resume_button.grid(row=6, column=0, columnspan=2)
 
-        x_label = Label(velocity_frame, text='X:')
-        x_vel_entry = Entry(velocity_frame, width=12)
-        x_label.pack(side=LEFT)
-        x_vel_entry.pack(side=LEFT, padx=5)
+        # global variables
+        self.body_rows = []
+        self.colors = []
+        self.system = nbody_system()
+        self.simulation = simulation(self.system, dt)
+        self.worker = None
+        self.replay = None
+        self.events_reported = 0
+        self.overlay_time = 0
 
-        y_label = Label(velocity_frame, text='Y:')
-        y_vel_entry = Entry(velocity_frame, width=12)
-        y_label.pack(side=LEFT)
-        y_vel_entry.pack(side=LEFT, padx=5)
+    def add_celestial_body(self):
+        self.planet_table.add_row()
 
-        self.satellite_frames.append(temp_frame)
+    def add_satellite(self):
+        self.satellite_table.add_row()
 
     def update_graph(self):
+        if self.running():
+            return
+
         # set the value of the variables from the specs frame
         self.update_specs()
 
-        # reset bodies list and clear graph
-        self.celestial_bodies = []
-        self.satellite_bodies = []
-
-        x_positions = []
-        y_positions = []
-        colors = []
-
-        # go through each celestial body in the planets frame
-        # add them to the celestial bodies list
-        # and plot them on the graph
-        index = 0
-        for body_frame_data in self.planets_frame.winfo_children():
-            widgets = body_frame_data.winfo_children()
-            if len(widgets) > 0:
-                position_data = widgets[1].winfo_children()
-                velocity_data = widgets[3].winfo_children()
-                mass_data = widgets[4].winfo_children()
-                if mass_data[1].get() != '' and position_data[1].get() != '' and position_data[3].get() != '' and velocity_data[1].get() != '' and velocity_data[3].get() != '':
-                    temp_mass = float(mass_data[1].get()) * earth_mass
-                    temp_x_pos = float(position_data[1].get()) * 1000
-                    temp_y_pos = float(position_data[3].get()) * 1000
-                    temp_x_vel = float(velocity_data[1].get())
-                    temp_y_vel = float(velocity_data[3].get())
-                    temp_celestial_body = celestial_body(temp_mass,temp_x_pos,temp_y_pos,temp_x_vel,temp_y_vel)
-                    self.celestial_bodies.append(temp_celestial_body)
-
-                    x_positions.append(temp_x_pos)
-                    y_positions.append(temp_y_pos)
-                    colors.append(color_map[index % len(color_map)])
-                    index += 1
-        
-        index = 0
-        for satellite_frame_data in self.satellites_frame.winfo_children():
-            widgets = satellite_frame_data.winfo_children()
-            if len(widgets) > 0:
-                position_data = widgets[1].winfo_children()
-                velocity_data = widgets[3].winfo_children()
-                if position_data[1].get() != '' and position_data[3].get() != '' and velocity_data[1].get() != '' and velocity_data[3].get() != '':
-                    temp_mass = 0
-                    temp_x_pos = float(position_data[1].get()) * 1000
-                    temp_y_pos = float(position_data[3].get()) * 1000
-                    temp_x_vel = float(velocity_data[1].get())
-                    temp_y_vel = float(velocity_data[3].get())
-                    temp_celestial_body = celestial_body(temp_mass,temp_x_pos,temp_y_pos,temp_x_vel,temp_y_vel)
-                    self.satellite_bodies.append(temp_celestial_body)
-
-                    x_positions.append(temp_x_pos)
-                    y_positions.append(temp_y_pos)
-                    colors.append(color_map[(index + len(self.celestial_bodies)) % len(color_map)])
-                    index += 1
-
-        self.main_graph.cla()
-        self.main_graph.scatter(x_positions, y_positions, c=colors)
-        self.main_graph.set_xlim(-1 * scale, scale)
-        self.main_graph.set_ylim(-1 * scale, scale)
-        self.canvas.draw()
+        # build the system from the table arrays, rows with blank cells are skipped
+        self.planet_table.commit()
+        self.satellite_table.commit()
+        planet_rows = self.planet_table.complete_rows()
+        satellite_rows = self.satellite_table.complete_rows()
+        # each table row is tied to the id its body gets in the system
+        self.body_rows = [(self.planet_table, planet_rows, np.arange(len(planet_rows))), (self.satellite_table, satellite_rows, len(planet_rows) + np.arange(len(satellite_rows)))]
+        columns = join_columns(*[{name: table.data[name][rows] for name in body_columns} for table, rows, ids in self.body_rows])
+        try:
+            validate_columns(columns)
+        except ValueError as error:
+            print(error)
+            return
+        self.system = system_from_columns(columns, {'G': G, 'solver': solver, 'theta': theta})
+
+        # planets come first in the system, so body i is always drawn with color i
+        self.colors = [color_map[index % len(color_map)] for index in range(len(self.system))]
+        self.simulation = simulation(self.system, dt, integrator, tol, collisions=self.make_collision_monitor())
+        self.replay = None
+        self.events_reported = 0
+        self.renderer.reset(self.system.pos, self.colors, scale, trail_length)
 
     def run_simulation(self):
-      t = time.time()
-      self.update_specs()
-
-      for i in range(run_time):
-          self.step_trajectories()
-          self.master.update_idletasks()
-          self.master.update()
+      if self.running():
+          return
+      self.run_start = time.time()
+      with profiler.phase('specs'):
+          self.apply_specs()
+      self.leave_replay()
+
+      if self.record_var.get():
+          path = filedialog.asksaveasfilename(defaultextension='.traj', filetypes=[('Trajectory', '*.traj')])
+          if path:
+              self.simulation.record(path, max(1, int(self.record_every_entry.get())))
+
+      self.simulation.checkpoint_path = None
+      if self.checkpoint_var.get():
+          path = filedialog.asksaveasfilename(defaultextension='.npz', filetypes=[('Checkpoint', '*.npz')])
+          if path:
+              settings = {'dt': dt, 'steps': self.simulation.steps_taken + run_time, 'integrator': integrator, 'tol': tol, 'collisions': None}
+              self.simulation.checkpoint(path, int(self.checkpoint_every_entry.get()), settings)
+
+      # the physics runs on a worker thread, this thread only draws the snapshots it sends
+      # snapshots are taken every render_every steps so drawing doesn't hold the physics back
+      self.worker = simulation_worker(self.simulation, run_time, render_every)
+      self.worker.start()
+      self.simulate_button.config(state=DISABLED)
+      self.step_forward_button.config(state=DISABLED)
+      self.pause_button.config(state=NORMAL, text='Pause')
+      self.cancel_button.config(state=NORMAL)
+      self.poll_worker()
+
+    def poll_worker(self):
+      frame = self.worker.latest()
+      if frame is not None:
+          self.update_overlay()
+          with profiler.phase('draw'):
+              self.graph_positions(frame.pos)
+
+      if self.worker.paused:
+          self.rate_label.config(text='Paused')
+      else:
+          self.rate_label.config(text=str(round(self.worker.steps_per_second, 1)) + ' steps/s')
+
+      if self.worker.is_alive() or not self.worker.snapshots.empty():
+          self.master.after(15, self.poll_worker)
+          return
+
+      # finished or cancelled, the simulation is safe to touch from this thread again
+      # the entries are only for display, the simulation keeps its own full precision state
+      self.simulate_button.config(state=NORMAL)
+      self.step_forward_button.config(state=NORMAL)
+      self.pause_button.config(state=DISABLED, text='Pause')
+      self.cancel_button.config(state=DISABLED)
+      self.simulation.stop_recording()
+      self.graph_positions()
+      self.refresh_entries()
+      if self.worker.error is not None:
+          print('Simulation stopped: ', self.worker.error)
+      print('Simulation time: ', time.time() - self.run_start)
+      print('Drift: ', self.simulation.drift())
+      self.report_events()
+      if profiler.enabled:
+          print(profiler.report())
+
+    def running(self):
+      return self.worker is not None and self.worker.is_alive()
+
+    def toggle_pause(self):
+      if not self.running():
+          return
+      if self.worker.paused:
+          self.worker.resume()
+          self.pause_button.config(text='Pause')
+      else:
+          self.worker.pause()
+          self.pause_button.config(text='Resume')
+
+    def cancel_simulation(self):
+      if self.running():
+          self.worker.cancel()
+
+    def open_recording(self):
+      # replay a trajectory file by scrubbing through its frames, nothing is re-simulated
+      if self.running():
+          return
+      path = filedialog.askopenfilename(filetypes=[('Trajectory', '*.traj'), ('All files', '*')])
+      if not path:
+          return
 
-      print('Simulation time: ', time.time() - t)
+      self.update_specs()
+      self.replay = trajectory_reader(path)
+      if len(self.replay) == 0:
+          self.replay = None
+          return
+      colors = [color_map[index % len(color_map)] for index in range(self.replay.n_bodies)]
+      self.renderer.reset(self.replay.positions[0], colors, scale, trail_length)
+      self.replay_scale.config(to=len(self.replay) - 1)
+      self.replay_scale.set(0)
+
+    def leave_replay(self):
+      # go back to drawing the live simulation
+      if self.replay is not None:
+          self.replay = None
+          self.renderer.reset(self.system.pos, self.colors, scale, trail_length)
+
+    def show_recorded_frame(self, value):
+      if self.replay is None or self.running():
+          return
+      time_s, pos, vel = self.replay.frame(int(float(value)))
+      self.renderer.update(pos)
 
     def step_trajectories(self):
-       self.update_specs()
-
-       self.update_velocities()
-       self.graph_positions()
-
-    def update_velocities(self):
-      for index in range(len(self.celestial_bodies)):
-          for i in range(len(self.celestial_bodies)):
-              if i != index:
-                  self.celestial_bodies[index].set_vel(self.celestial_bodies[i])
-
-          body_frame_data = self.planets_frame.winfo_children()[index + 1]
-          widgets = body_frame_data.winfo_children()
-          velocity_data = widgets[3].winfo_children()
-
-          body = self.celestial_bodies[index]
-          velocity_data[1].delete(0,END)
-          velocity_data[1].insert(0, round(body.vel[0], keep_decimals_velocity))
-          velocity_data[3].delete(0,END)
-          velocity_data[3].insert(0, round(body.vel[1], keep_decimals_velocity))
-
-      for index in range(len(self.satellite_bodies)):
-          for i in range(len(self.celestial_bodies)):
-              self.satellite_bodies[index].set_vel(self.celestial_bodies[i])
-
-          body_frame_data = self.satellites_frame.winfo_children()[index + 1]
-          widgets = body_frame_data.winfo_children()
-          velocity_data = widgets[3].winfo_children()
-
-          body = self.satellite_bodies[index]
-          velocity_data[1].delete(0,END)
-          velocity_data[1].insert(0, round(body.vel[0], keep_decimals_velocity))
-          velocity_data[3].delete(0,END)
-          velocity_data[3].insert(0, round(body.vel[1], keep_decimals_velocity))
-
-    def graph_positions(self):
-        x_positions = []
-        y_positions = []
-        colors = []
-
-        for index in range(len(self.celestial_bodies)):
-            self.celestial_bodies[index].set_pos()
-            body = self.celestial_bodies[index]
-            body_frame_data = self.planets_frame.winfo_children()[index + 1]
-            widgets = body_frame_data.winfo_children()
-            position_data = widgets[1].winfo_children()
-
-            position_data[1].delete(0,END)
-            position_data[1].insert(0, round(body.pos[0]/1000, keep_decimals_position))
-            position_data[3].delete(0,END)
-            position_data[3].insert(0, round(body.pos[1]/1000, keep_decimals_position))
-
-            x_positions.append(body.pos[0])
-            y_positions.append(body.pos[1])
-            colors.append(color_map[index % len(color_map)])
-
-        for index in range(len(self.satellite_bodies)):
-            self.satellite_bodies[index].set_pos()
-            body = self.satellite_bodies[index]
-            body_frame_data = self.satellites_frame.winfo_children()[index + 1]
-            widgets = body_frame_data.winfo_children()
-            position_data = widgets[1].winfo_children()
-
-            position_data[1].delete(0,END)
-            position_data[1].insert(0, round(body.pos[0]/1000, keep_decimals_position))
-            position_data[3].delete(0,END)
-            position_data[3].insert(0, round(body.pos[1]/1000, keep_decimals_position))
-
-            x_positions.append(body.pos[0])
-            y_positions.append(body.pos[1])
-            colors.append(color_map[(index + len(self.celestial_bodies)) % len(color_map)])
-
-        self.main_graph.cla()
-        self.main_graph.scatter(x_positions, y_positions, c=colors)
-        self.main_graph.set_xlim(-1 * scale, scale)
-        self.main_graph.set_ylim(-1 * scale, scale)
-        self.canvas.draw()
+       if self.running():
+           return
+       with profiler.phase('specs'):
+           self.apply_specs()
+       self.leave_replay()
+
+       self.simulation.step()
+       with profiler.phase('entries'):
+           self.refresh_entries()
+       self.update_overlay()
+       with profiler.phase('draw'):
+           self.graph_positions()
+       self.report_events()
+
+    def resume_checkpoint(self):
+        # carry on from an exact checkpoint, the tables are refilled from its arrays
+        if self.running():
+            return
+        path = filedialog.askopenfilename(filetypes=[('Checkpoint', '*.npz'), ('All files', '*')])
+        if not path:
+            return
+        try:
+            self.simulation, settings = resume(path)
+        except (OSError, ValueError, KeyError) as error:
+            print('Could not resume checkpoint: ', error)
+            return
+        self.system = self.simulation.system
+
+        if settings is not None:
+            self.dt_entry.delete(0,END)
+            self.dt_entry.insert(0, settings['dt'] / day)
+            self.integrator_var.set(settings['integrator'])
+            self.tol_entry.delete(0,END)
+            self.tol_entry.insert(0, settings['tol'])
+        self.G_constant_entry.delete(0,END)
+        self.G_constant_entry.insert(0, self.system.G / (10**-11))
+        self.solver_var.set(self.system.solver)
+        self.theta_entry.delete(0,END)
+        self.theta_entry.insert(0, self.system.theta)
+        monitor = self.simulation.collisions
+        self.collision_var.set(monitor.policy if monitor is not None else 'none')
+        self.encounter_entry.delete(0,END)
+        self.encounter_entry.insert(0, monitor.encounter_distance / 1000 if monitor is not None else 0)
+        self.update_specs()
+
+        columns = columns_from_system(self.system)
+        massive = self.system.mass > 0
+        self.planet_table.set_data({name: values[massive] for name, values in columns.items()})
+        self.satellite_table.set_data({name: values[~massive] for name, values in columns.items()})
+        self.body_rows = [(self.planet_table, np.arange(massive.sum()), self.system.ids[massive]), (self.satellite_table, np.arange((~massive).sum()), self.system.ids[~massive])]
+
+        self.colors = [color_map[index % len(color_map)] for index in range(len(self.simulation.initial_ids))]
+        self.replay = None
+        self.events_reported = len(monitor.events) if monitor is not None else 0
+        self.renderer.reset(self.simulation.full_state()[0], self.colors, scale, trail_length)
+
+    def toggle_profiling(self):
+        if self.profile_var.get():
+            profiler.reset()
+            profiler.enable(trace=True)
+        else:
+            profiler.disable()
+            self.renderer.set_overlay('')
+
+    def update_overlay(self):
+        # mean time per phase drawn over the plot, refreshed a few times a second
+        if not profiler.enabled or not self.overlay_var.get():
+            self.renderer.set_overlay('')
+            return
+        now = time.time()
+        if now - self.overlay_time < 0.25:
+            return
+        self.overlay_time = now
+        lines = []
+        for name in ('step', 'integrate', 'forces', 'collisions', 'record', 'draw', 'entries', 'specs'):
+            stats = profiler.phases.get(name)
+            if stats is not None:
+                lines.append('{:<10} {:>9.3f} ms'.format(name, stats.total / stats.count / 1e6))
+        lines.append('forces {}  cached {}'.format(profiler.counters['force_evaluations'], profiler.counters['force_cache_hits']))
+        self.renderer.set_overlay('\n'.join(lines))
+
+    def export_trace(self):
+        path = filedialog.asksaveasfilename(defaultextension='.json', filetypes=[('Chrome trace', '*.json')])
+        if path:
+            profiler.export_chrome_trace(path)
+            print(profiler.report())
+
+    def refresh_entries(self):
+        # write the current state back into the tables, they round it only for display
+        # bodies keep their ids through merges, and a body merged away gets blank cells
+        columns = columns_from_system(self.system)
+        for table, rows, ids in self.body_rows:
+            slots = np.minimum(np.searchsorted(self.system.ids, ids), max(len(self.system) - 1, 0))
+            alive = self.system.ids[slots] == ids if len(self.system) > 0 else np.zeros(len(ids), dtype=bool)
+            for name in table.columns:
+                table.data[name][rows[alive]] = columns[name][slots[alive]]
+                table.data[name][rows[~alive]] = np.nan
+            table.show()
+
+    def graph_positions(self, pos=None):
+        # positions have one row per starting body, bodies merged away are NaN and not drawn
+        if pos is None:
+            pos = self.simulation.full_state()[0]
+        if self.renderer.scale != scale or self.renderer.trail_length != trail_length:
+            self.renderer.reset(pos, self.colors, scale, trail_length)
+        else:
+            self.renderer.update(pos)
+
+    def load_scenario(self):
+        if self.running():
+            return
+        path = filedialog.askopenfilename(filetypes=[('Scenario', '*.json *.csv'), ('All files', '*')])
+        if not path:
+            return
+        try:
+            columns, settings = read_scenario(path)
+        except (OSError, ValueError) as error:
+            print('Could not load scenario: ', error)
+            return
+
+        # the specs take the scenario's settings, everything is already in the entry units
+        for entry, value in ((self.dt_entry, settings['dt']), (self.G_constant_entry, settings['G']), (self.run_time_entry, settings['steps']), (self.theta_entry, settings['theta']), (self.tol_entry, settings['tol'])):
+            entry.delete(0,END)
+            entry.insert(0, value)
+        self.solver_var.set(settings['solver'])
+        self.integrator_var.set(settings['integrator'])
+        collisions = settings['collisions'] or {}
+        self.collision_var.set(collisions.get('policy', 'none'))
+        self.encounter_entry.delete(0,END)
+        self.encounter_entry.insert(0, collisions.get('encounter_distance', 0))
+
+        massive = columns['mass'] > 0
+        self.planet_table.set_data({name: values[massive] for name, values in columns.items()})
+        self.satellite_table.set_data({name: values[~massive] for name, values in columns.items()})
+        self.update_graph()
+
+    def save_scenario(self):
+        # saves the simulation's own arrays, not the rounded table text
+        if self.running():
+            return
+        path = filedialog.asksaveasfilename(defaultextension='.json', filetypes=[('JSON scenario', '*.json'), ('CSV scenario', '*.csv')])
+        if not path:
+            return
+        self.apply_specs()
+        collisions = None
+        if collision_policy != 'none' or encounter_distance > 0:
+            collisions = {'policy': collision_policy, 'encounter_distance': encounter_distance / 1000}
+        save_scenario(path, self.system, {'dt': dt, 'steps': run_time, 'integrator': integrator, 'tol': tol, 'collisions': collisions})
 
     def update_specs(self):
         global dt
@@ -374,10 +545,66 @@ class Orbit_GUI:
         run_time = int(self.run_time_entry.get())
         global scale
         scale = int(self.scale_entry.get()) * 1000
+        global solver
+        solver = self.solver_var.get()
+        global theta
+        theta = float(self.theta_entry.get())
+        global integrator
+        integrator = self.integrator_var.get()
+        global tol
+        tol = float(self.tol_entry.get())
+        global render_every
+        render_every = max(1, int(self.render_every_entry.get()))
+        global trail_length
+        trail_length = max(0, int(self.trail_length_entry.get()))
+        global collision_policy
+        collision_policy = self.collision_var.get()
+        global encounter_distance
+        encounter_distance = float(self.encounter_entry.get()) * 1000
+
+    def apply_specs(self):
+        # push the specs onto the running simulation without rebuilding it
+        self.update_specs()
+        # the entries hold dt in days and G in E^-11, so converting back can be an ulp off
+        # only a real change is pushed, which keeps a resumed checkpoint bit for bit on track
+        if not m.isclose(self.simulation.dt, dt, rel_tol=1e-12):
+            self.simulation.dt = dt
+        if not m.isclose(self.system.G, G, rel_tol=1e-12):
+            self.system.G = G
+        self.system.solver = solver
+        self.system.theta = theta
+        if not isinstance(self.simulation.integrator, integrators[integrator]):
+            self.simulation.integrator = make_integrator(integrator, tol)
+        elif self.simulation.integrator.adaptive:
+            self.simulation.integrator.tol = tol
+        monitor = self.simulation.collisions
+        if monitor is None or monitor.policy != collision_policy or monitor.encounter_distance != encounter_distance:
+            self.simulation.collisions = self.make_collision_monitor()
+            self.simulation.stopped = False
+
+    def make_collision_monitor(self):
+        self.system.softening = 0.0
+        if collision_policy == 'none' and encounter_distance <= 0:
+            return None
+        # the soften policy smooths the force out to the size of the largest body
+        softening = float(self.system.radius.max()) if len(self.system) > 0 else 0.0
+        monitor = collision_monitor(collision_policy, encounter_distance, softening)
+        monitor.attach(self.system)
+        return monitor
+
+    def report_events(self):
+        # print the encounters and collisions logged since the last report
+        monitor = self.simulation.collisions
+        if monitor is None:
+            return
+        for event in monitor.events[self.events_reported:]:
+            print(event['kind'].capitalize(), 'between bodies', event['bodies'][0], 'and', event['bodies'][1], 'at', round(event['time'] / day, 3), 'days,', round(event['distance'] / 1000, 1), 'km apart')
+        self.events_reported = len(monitor.events)
 
 
 ### Implementation
-root = Tk()
-root.title("Orbit Simulator")
-window = Orbit_GUI(root)
-root.mainloop()
\ No newline at end of file
+if __name__ == '__main__':
+    root = Tk()
+    root.title("Orbit Simulator")
+    window = Orbit_GUI(root)
+    root.mainloop()
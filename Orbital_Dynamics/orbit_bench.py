@@ -0,0 +1,214 @@
+'''
+Headless benchmark suite for the orbit engine.
+
+Every case builds a seeded random disk (one central mass with bodies on circular orbits,
+plus massless satellites if asked for) and times single simulation steps with no GUI in
+the way. Each case runs until it has enough steps or its time budget is used up, so
+large body counts still finish. Results are JSON and can be compared against an earlier
+run; the comparison exits non-zero when a case's throughput drops more than the threshold.
+
+Cases are named like 'nbody/direct/leapfrog/n=1000/s=0' so results from different
+commits line up.
+
+Usage:
+    python orbit_bench.py --output bench.json
+    python orbit_bench.py --quick --compare bench.json --threshold 0.15
+    python orbit_bench.py --bodies 2 1000 100000 --solvers barnes_hut --integrators leapfrog
+'''
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import numpy as np
+from orbit_engine import day, earth_mass, G, nbody_system, solvers
+from orbit_integrators import integrators
+from orbit_sim import simulation
+from orbit_satellites import propagate
+
+default_bodies = (2, 10, 100, 1000, 10000, 100000)
+default_satellites = (0, 1000, 100000)
+quick_bodies = (2, 10, 100, 1000)
+quick_satellites = (0, 1000)
+
+# direct summation is O(N^2) per force evaluation, past this it's left to barnes_hut
+max_direct_bodies = 20000
+
+
+def disk_scenario(bodies, satellites=0, seed=0):
+    # one earth mass at the centre, the rest spread over a disk on circular orbits
+    rng = np.random.default_rng(seed)
+    n = bodies + satellites
+    radius = 1e7 + 4e8 * np.sqrt(rng.random(n - 1))
+    angle = rng.random(n - 1) * 2 * np.pi
+    speed = np.sqrt(G * earth_mass / radius)
+
+    masses = np.zeros(n)
+    masses[0] = earth_mass
+    masses[1:bodies] = earth_mass * 1e-6 * (1 + rng.random(bodies - 1))
+    pos = np.zeros((n, 2))
+    vel = np.zeros((n, 2))
+    pos[1:, 0] = radius * np.cos(angle)
+    pos[1:, 1] = radius * np.sin(angle)
+    vel[1:, 0] = -speed * np.sin(angle)
+    vel[1:, 1] = speed * np.cos(angle)
+    return masses, pos, vel
+
+
+def time_steps(step, min_steps, max_steps, budget):
+    # per-step latencies in seconds, after one untimed warm up step
+    step()
+    latencies = []
+    start = time.perf_counter()
+    while len(latencies) < max_steps:
+        t = time.perf_counter()
+        step()
+        latencies.append(time.perf_counter() - t)
+        if len(latencies) >= min_steps and time.perf_counter() - start >= budget:
+            break
+    return np.array(latencies)
+
+
+def summarize(name, params, latencies, steps=None, seconds=None):
+    steps = len(latencies) if steps is None else steps
+    seconds = float(latencies.sum()) if seconds is None else seconds
+    result = dict(name=name, **params)
+    result.update({
+        'steps': steps,
+        'seconds': seconds,
+        'steps_per_second': steps / seconds if seconds > 0 else None,
+        'latency_ms': {
+            'mean': 1000 * seconds / steps,
+            'median': 1000 * float(np.median(latencies)),
+            'p90': 1000 * float(np.percentile(latencies, 90)),
+            'p99': 1000 * float(np.percentile(latencies, 99)),
+            'max': 1000 * float(latencies.max()),
+        },
+    })
+    return result
+
+
+def bench_nbody(bodies, satellites, solver, integrator, seed=0, min_steps=5, max_steps=1000, budget=1.0):
+    masses, pos, vel = disk_scenario(bodies, satellites, seed)
+    system = nbody_system(masses, pos, vel, G, solver)
+    sim = simulation(system, 0.01 * day, integrator, diagnostics=False)
+    latencies = time_steps(sim.step, min_steps, max_steps, budget)
+    name = 'nbody/' + solver + '/' + integrator + '/n=' + str(bodies) + '/s=' + str(satellites)
+    params = {'kind': 'nbody', 'bodies': bodies, 'satellites': satellites, 'solver': solver, 'integrator': integrator}
+    result = summarize(name, params, latencies)
+    result['force_evaluations'] = system.force_evaluations
+    return result
+
+
+def bench_propagate(bodies, satellites, integrator, seed=0, steps=64, workers=1):
+    # the bulk satellite path times the whole run, so the latency is the mean per step
+    masses, pos, vel = disk_scenario(bodies, satellites, seed)
+    planets = nbody_system(masses[:bodies], pos[:bodies], vel[:bodies], G)
+    t = time.perf_counter()
+    propagate(planets, pos[bodies:], vel[bodies:], 0.01 * day, steps, integrator, workers)
+    seconds = time.perf_counter() - t
+    name = 'propagate/' + integrator + '/n=' + str(bodies) + '/s=' + str(satellites) + '/w=' + str(workers)
+    params = {'kind': 'propagate', 'bodies': bodies, 'satellites': satellites, 'solver': 'direct', 'integrator': integrator, 'workers': workers}
+    return summarize(name, params, np.full(steps, seconds / steps), steps, seconds)
+
+
+def environment():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except OSError:
+        commit = ''
+    return {
+        'commit': commit or None,
+        'python': sys.version.split()[0],
+        'numpy': np.__version__,
+        'platform': platform.platform(),
+        'processor': platform.processor() or platform.machine(),
+        'cpu_count': os.cpu_count(),
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+    }
+
+
+def run_suite(bodies, satellites, solver_names, integrator_names, budget=1.0, seed=0, log=print):
+    cases = []
+    for solver in solver_names:
+        for integrator in integrator_names:
+            for n in bodies:
+                if solver == 'direct' and n > max_direct_bodies:
+                    continue
+                result = bench_nbody(n, 0, solver, integrator, seed, budget=budget)
+                log_case(result, log)
+                cases.append(result)
+
+    # satellites ride along a small system, once inside it and once on the bulk replay path
+    for s in satellites:
+        if s == 0:
+            continue
+        for integrator in integrator_names:
+            if integrators[integrator].adaptive:
+                continue
+            result = bench_nbody(3, s, 'direct', integrator, seed, budget=budget)
+            log_case(result, log)
+            cases.append(result)
+            result = bench_propagate(3, s, integrator, seed)
+            log_case(result, log)
+            cases.append(result)
+    return cases
+
+
+def log_case(result, log):
+    if log is not None:
+        log('{:<45} {:>12.1f} steps/s  median {:>10.3f} ms  p99 {:>10.3f} ms'.format(result['name'], result['steps_per_second'], result['latency_ms']['median'], result['latency_ms']['p99']))
+
+
+def compare(results, baseline, threshold):
+    # cases slower than the baseline by more than threshold (a fraction), as (name, old, new)
+    old = {case['name']: case['steps_per_second'] for case in baseline['cases']}
+    regressions = []
+    for case in results['cases']:
+        if case['name'] in old and old[case['name']] and case['steps_per_second'] < old[case['name']] * (1 - threshold):
+            regressions.append((case['name'], old[case['name']], case['steps_per_second']))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the orbit engine without the GUI.')
+    parser.add_argument('--bodies', type=int, nargs='+', help='body counts (default: 2 to 10^5)')
+    parser.add_argument('--satellites', type=int, nargs='+', help='satellite counts around a three body system')
+    parser.add_argument('--solvers', nargs='+', choices=solvers, default=list(solvers))
+    parser.add_argument('--integrators', nargs='+', choices=sorted(integrators), default=['euler', 'leapfrog', 'rk4'])
+    parser.add_argument('--budget', type=float, default=1.0, help='seconds to spend on each case (at least 5 steps are always timed)')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--quick', action='store_true', help='only the small body and satellite counts')
+    parser.add_argument('--output', help='write the results to this JSON file')
+    parser.add_argument('--compare', help='baseline JSON from an earlier run')
+    parser.add_argument('--threshold', type=float, default=0.1, help='allowed throughput drop against the baseline, as a fraction')
+    args = parser.parse_args(argv)
+
+    bodies = args.bodies or (quick_bodies if args.quick else default_bodies)
+    satellites = args.satellites if args.satellites is not None else (quick_satellites if args.quick else default_satellites)
+
+    results = {
+        'environment': environment(),
+        'settings': {'budget': args.budget, 'seed': args.seed},
+        'cases': run_suite(bodies, satellites, args.solvers, args.integrators, args.budget, args.seed),
+    }
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(results, file, indent=1)
+
+    if args.compare:
+        with open(args.compare) as file:
+            baseline = json.load(file)
+        regressions = compare(results, baseline, args.threshold)
+        for name, old, new in regressions:
+            print('REGRESSION', name, round(old, 1), '->', round(new, 1), 'steps/s', '(' + str(round(100 * (new / old - 1), 1)) + '%)')
+        if regressions:
+            sys.exit(1)
+        print('No case slower than the baseline by more than', str(round(100 * args.threshold)) + '%')
+
+
+if __name__ == '__main__':
+    main()
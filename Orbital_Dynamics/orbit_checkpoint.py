@@ -0,0 +1,132 @@
+'''
+Exact checkpoints of a running simulation.
+
+A checkpoint is an .npz file holding every body array at full precision (mass, pos, vel,
+radius, ids and any cached forces), plus a JSON block with the simulation time, step count, force settings,
+the integrator's own state (the adaptive step size for dopri5) and the collision
+monitor's state. Floats in the JSON block are written with repr, so they round trip
+exactly and a run resumed from a checkpoint matches the uninterrupted run bit for bit.
+
+Checkpoints are written to a temporary file in the same directory, synced and then
+renamed over the old one, so a machine dying mid-write leaves the previous checkpoint
+intact rather than a torn file.
+
+Usage:
+    python orbit_sim.py scenario.json --steps 1000000 --checkpoint run.ckpt.npz --checkpoint-every 10000
+    python orbit_sim.py --resume run.ckpt.npz
+'''
+
+import json
+import os
+import tempfile
+import numpy as np
+from orbit_engine import nbody_system
+from orbit_integrators import integrators
+from orbit_collisions import collision_monitor
+
+version = 1
+
+
+def integrator_name(integrator):
+    for name, kind in integrators.items():
+        if type(integrator) is kind:
+            return name
+    raise ValueError('unknown integrator: ' + type(integrator).__name__)
+
+
+def checkpoint_state(sim, settings=None):
+    # arrays and a JSON-able dict describing the whole simulation
+    system = sim.system
+    arrays = {
+        'mass': system.mass,
+        'pos': system.pos,
+        'vel': system.vel,
+        'radius': system.radius,
+        'ids': system.ids,
+        'initial_ids': sim.initial_ids,
+    }
+    meta = {
+        'version': version,
+        'time': sim.time,
+        'steps_taken': sim.steps_taken,
+        'dt': sim.dt,
+        'stopped': sim.stopped,
+        'G': system.G,
+        'solver': system.solver,
+        'theta': system.theta,
+        'softening': system.softening,
+        'force_evaluations': system.force_evaluations,
+        'integrator': integrator_name(sim.integrator),
+        'integrator_state': dict(vars(sim.integrator)),
+        'diagnostics': sim.diagnostics,
+        'initial_energy': sim.initial_energy if sim.diagnostics else None,
+        'initial_angular_momentum': sim.initial_angular_momentum if sim.diagnostics else None,
+        'collisions': None,
+        'settings': settings,
+    }
+    # forces cached at the current positions are saved too, so the resumed run reuses them
+    # exactly like the uninterrupted one and even the force evaluation count matches
+    if system._last_forces is not None:
+        last_pos, last_mass, last_settings, acc = system._last_forces
+        if last_pos.shape == system.pos.shape and np.array_equal(last_pos, system.pos) and np.array_equal(last_mass, system.mass):
+            arrays['forces'] = acc
+
+    monitor = sim.collisions
+    if monitor is not None:
+        meta['collisions'] = {
+            'policy': monitor.policy,
+            'encounter_distance': monitor.encounter_distance,
+            'softening': monitor.softening,
+            'events': monitor.events,
+            'stopped': monitor.stopped,
+            'close': sorted([a, b, kind] for (a, b), kind in monitor.close.items()),
+        }
+    return arrays, meta
+
+
+def save_checkpoint(path, sim, settings=None):
+    arrays, meta = checkpoint_state(sim, settings)
+    directory = os.path.dirname(os.path.abspath(path))
+    handle, temp = tempfile.mkstemp(prefix='.' + os.path.basename(path) + '.', dir=directory)
+    try:
+        with os.fdopen(handle, 'wb') as file:
+            np.savez(file, meta=np.array(json.dumps(meta)), **arrays)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temp, path)
+    except BaseException:
+        os.remove(temp)
+        raise
+
+    # make the rename itself durable where the platform allows syncing a directory
+    if hasattr(os, 'O_DIRECTORY'):
+        descriptor = os.open(directory, os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            os.fsync(descriptor)
+        finally:
+            os.close(descriptor)
+
+
+def load_checkpoint(path):
+    # the system and collision monitor as they were, plus the JSON block (see resume in orbit_sim.py)
+    with np.load(path) as data:
+        meta = json.loads(str(data['meta']))
+        arrays = {name: data[name] for name in data.files if name != 'meta'}
+    if meta.get('version') != version:
+        raise ValueError(str(path) + ' is not a supported checkpoint')
+
+    system = nbody_system(arrays['mass'], arrays['pos'], arrays['vel'], meta['G'], meta['solver'], meta['theta'], arrays['radius'], meta['softening'])
+    system.ids = arrays['ids']
+    system.force_evaluations = meta['force_evaluations']
+    meta['initial_ids'] = arrays['initial_ids']
+    if 'forces' in arrays:
+        system._last_forces = (system.pos.copy(), system.mass.copy(), (system.G, system.solver, system.theta, system.softening), arrays['forces'])
+
+    monitor = None
+    saved = meta['collisions']
+    if saved is not None:
+        monitor = collision_monitor(saved['policy'], saved['encounter_distance'], saved['softening'])
+        monitor.events = saved['events']
+        monitor.stopped = saved['stopped']
+        monitor.close = {(a, b): kind for a, b, kind in saved['close']}
+    return system, monitor, meta
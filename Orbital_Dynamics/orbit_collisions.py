@@ -0,0 +1,154 @@
+'''
+Close encounter and collision detection.
+
+Candidate pairs come from a uniform grid spatial hash: every body is dropped into a square
+cell at least as wide as the largest interaction reach, so any pair close enough to matter
+sits in the same or a neighbouring cell. Looking at half of the neighbouring cells visits
+each such pair once, which keeps a step at roughly O(N) instead of checking every pair.
+
+Pairs whose centres come closer than the encounter distance are logged as encounters.
+Policies for bodies that touch (separation below the sum of their radii):
+    'merge'  - combine them into one body, conserving mass and momentum
+    'stop'   - log the collision and stop the run
+    'soften' - log it and rely on a softened force law (Plummer softening) to keep it finite
+    'none'   - only log it
+'''
+
+import numpy as np
+
+policies = ('none', 'merge', 'stop', 'soften')
+
+# grid cells per axis are capped so hash keys fit in 64 bits
+max_cells = 2**30
+
+# the cell (0, 0) plus half of its neighbours
+neighbour_offsets = ((0, 0), (1, -1), (1, 0), (1, 1), (0, 1))
+
+
+def close_pairs(pos, reach):
+    # every pair (i < j) closer than reach[i] + reach[j]
+    n = len(pos)
+    if n < 2 or reach.max() <= 0:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+
+    lo = pos.min(axis=0)
+    span = float((pos.max(axis=0) - lo).max())
+    size = max(2 * reach.max(), span / max_cells)
+    cell = ((pos - lo) / size).astype(np.int64)
+    width = int(cell[:, 1].max()) + 3
+    key = cell[:, 0] * width + cell[:, 1]
+
+    order = np.argsort(key, kind='stable')
+    sorted_key = key[order]
+
+    first = []
+    second = []
+    for dx, dy in neighbour_offsets:
+        # queries go in sorted order, which keeps the binary searches cache friendly
+        target = sorted_key + dx * width + dy
+        start = np.searchsorted(sorted_key, target, 'left')
+        count = np.searchsorted(sorted_key, target, 'right') - start
+
+        owner = np.repeat(order, count)
+        offsets = np.arange(count.sum()) - np.repeat(np.cumsum(count) - count, count)
+        other = order[np.repeat(start, count) + offsets]
+        if (dx, dy) == (0, 0):
+            keep = other > owner
+            owner = owner[keep]
+            other = other[keep]
+        first.append(owner)
+        second.append(other)
+
+    i = np.concatenate(first)
+    j = np.concatenate(second)
+    d = pos[j] - pos[i]
+    close = np.einsum('ij,ij->i', d, d) < (reach[i] + reach[j])**2
+    i = i[close]
+    j = j[close]
+    return np.minimum(i, j), np.maximum(i, j)
+
+
+class collision_monitor:
+    def __init__(self, policy='merge', encounter_distance=0.0, softening=0.0):
+        if policy not in policies:
+            raise ValueError('unknown collision policy: ' + str(policy))
+        self.policy = policy
+        self.encounter_distance = encounter_distance
+        self.softening = softening
+        self.events = []
+        self.stopped = False
+        # pairs that are currently close, with the kind of event last logged for them
+        self.close = {}
+
+    def attach(self, system):
+        if self.policy == 'soften':
+            system.softening = self.softening
+
+    def check(self, system, time, step):
+        # look for new encounters and collisions after a step, returns the new events
+        # candidates come from the larger of the two reaches, then each pair is held to its own
+        # thresholds: centres closer than encounter_distance, or touching
+        reach = np.maximum(system.radius, self.encounter_distance / 2)
+        i, j = close_pairs(system.pos, reach)
+        d = np.linalg.norm(system.pos[j] - system.pos[i], axis=1)
+        touching = d < system.radius[i] + system.radius[j]
+        near = touching | (d < self.encounter_distance)
+        i, j, d, touching = i[near], j[near], d[near], touching[near]
+
+        events = []
+        close = {}
+        for a, b, distance, hit in zip(system.ids[i], system.ids[j], d, touching):
+            pair = (int(a), int(b))
+            # a pair is logged when it first comes close and again when it first touches,
+            # not on every step it stays close
+            logged = self.close.get(pair)
+            if hit and logged != 'collision':
+                kind = 'collision'
+            elif logged is None:
+                kind = 'encounter'
+            else:
+                close[pair] = logged
+                continue
+            close[pair] = kind
+            events.append({'time': time, 'step': step, 'kind': kind, 'bodies': list(pair), 'distance': float(distance)})
+        self.close = close
+        self.events.extend(events)
+
+        if touching.any():
+            if self.policy == 'merge':
+                self.merge(system, i[touching], j[touching])
+            elif self.policy == 'stop':
+                self.stopped = True
+        return events
+
+    def merge(self, system, i, j):
+        # union the colliding pairs into groups, then replace each group by one body
+        parent = {}
+
+        def root(k):
+            while parent.get(k, k) != k:
+                k = parent[k]
+            return k
+
+        for a, b in zip(i.tolist(), j.tolist()):
+            ra, rb = root(a), root(b)
+            if ra != rb:
+                parent[max(ra, rb)] = min(ra, rb)
+
+        groups = {}
+        for k in set(i.tolist()) | set(j.tolist()):
+            groups.setdefault(root(k), []).append(k)
+
+        removed = []
+        for keep, members in groups.items():
+            members = np.array(sorted(members))
+            mass = system.mass[members]
+            total = mass.sum()
+            # massless bodies that hit something are simply absorbed
+            weight = mass / total if total > 0 else np.full(len(members), 1 / len(members))
+            system.pos[keep] = weight @ system.pos[members]
+            system.vel[keep] = weight @ system.vel[members]
+            system.mass[keep] = total
+            system.radius[keep] = np.sum(system.radius[members]**3)**(1/3)
+            removed.extend(members[members != keep])
+        system.remove_bodies(removed)
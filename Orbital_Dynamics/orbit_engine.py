@@ -0,0 +1,243 @@
+import numpy as np
+from orbit_tree import tree_accelerations
+from orbit_profile import profiler
+
+day = 86400
+earth_mass = 5.97219 * (10**24)
+G = 6.67430 * (10**-11)
+
+# upper bound on the number of pair interactions held in memory at once
+pair_block = 2**20
+
+# force solvers an nbody_system can use
+solvers = ('direct', 'barnes_hut')
+
+
+def field_accelerations(targets, src_pos, src_mass, G, softening=0.0):
+    # acceleration felt by massless targets from every source, in blocks of targets
+    # softening is a Plummer length added in quadrature to every separation
+    acc = np.zeros((len(targets), 2))
+    if len(src_mass) == 0:
+        return acc
+
+    block = max(1, pair_block // len(src_mass))
+    for start in range(0, len(targets), block):
+        d = src_pos[None, :, :] - targets[start:start + block, None, :]
+        r2 = np.einsum('ijk,ijk->ij', d, d)
+        r2s = r2 + softening**2
+        with np.errstate(divide='ignore'):
+            w = np.where(r2 > 0, src_mass / (r2s * np.sqrt(r2s)), 0.0)
+        acc[start:start + block] = np.einsum('ij,ijk->ik', w, d)
+
+    return acc * G
+
+
+def direct_accelerations(pos, mass, G, softening=0.0):
+    # all-pairs gravity, each pair of massive bodies is visited once (Newton's third law)
+    # bodies with zero mass are treated as test particles and never act as sources
+    acc = np.zeros_like(pos)
+    sources = np.flatnonzero(mass)
+    tests = np.flatnonzero(mass == 0)
+    src_pos = pos[sources]
+    src_mass = mass[sources]
+    n = len(sources)
+
+    if n > 1:
+        src_acc = np.zeros((n, 2))
+        start = 0
+        while start < n - 1:
+            # rows [start, stop) against columns [start, n), keeping only j > i
+            block = max(1, pair_block // (n - start))
+            stop = min(n, start + block)
+            d = src_pos[None, start:, :] - src_pos[start:stop, None, :]
+            r2 = np.einsum('ijk,ijk->ij', d, d)
+            r2s = r2 + softening**2
+            # coincident bodies pull on each other with zero force, like in field_accelerations
+            upper = (np.arange(start, n)[None, :] > np.arange(start, stop)[:, None]) & (r2 > 0)
+            with np.errstate(divide='ignore'):
+                w = np.where(upper, 1 / (r2s * np.sqrt(r2s)), 0.0)
+
+            pull = w[:, :, None] * d
+            src_acc[start:stop] += np.einsum('j,ijk->ik', src_mass[start:], pull)
+            src_acc[start:] -= np.einsum('i,ijk->jk', src_mass[start:stop], pull)
+            start = stop
+
+        acc[sources] = src_acc * G
+
+    if len(tests) > 0:
+        acc[tests] = field_accelerations(pos[tests], src_pos, src_mass, G, softening)
+
+    return acc
+
+
+def potential_energy(pos, mass, G, softening=0.0):
+    # -G m_i m_j / r summed over every pair of massive bodies, in the same blocks as direct_accelerations
+    sources = np.flatnonzero(mass)
+    src_pos = pos[sources]
+    src_mass = mass[sources]
+    n = len(sources)
+
+    energy = 0.0
+    start = 0
+    while start < n - 1:
+        block = max(1, pair_block // (n - start))
+        stop = min(n, start + block)
+        d = src_pos[None, start:, :] - src_pos[start:stop, None, :]
+        r = np.sqrt(np.einsum('ijk,ijk->ij', d, d) + softening**2)
+        upper = np.arange(start, n)[None, :] > np.arange(start, stop)[:, None]
+        with np.errstate(divide='ignore'):
+            w = np.where(upper, 1 / r, 0.0)
+        energy -= np.einsum('i,ij,j->', src_mass[start:stop], w, src_mass[start:])
+        start = stop
+
+    return energy * G
+
+
+class nbody_system:
+    # struct-of-arrays state for every body in a simulation
+    # ids follow each body through removals, so callers can map rows back to their own records
+    def __init__(self, masses=(), positions=(), velocities=(), G=G, solver='direct', theta=0.5, radii=None, softening=0.0):
+        if solver not in solvers:
+            raise ValueError('unknown force solver: ' + str(solver))
+        self.mass = np.array(masses, dtype=float).reshape(-1)
+        self.pos = np.array(positions, dtype=float).reshape(-1, 2)
+        self.vel = np.array(velocities, dtype=float).reshape(-1, 2)
+        self.radius = np.zeros(len(self.mass)) if radii is None else np.array(radii, dtype=float).reshape(-1)
+        self.ids = np.arange(len(self.mass))
+        self.G = G
+        self.solver = solver
+        self.theta = theta
+        self.softening = softening
+        self.force_evaluations = 0
+        self._last_forces = None
+
+    def __len__(self):
+        return len(self.mass)
+
+    def add_body(self, mass, posX, posY, velX, velY, radius=0.0):
+        self.mass = np.append(self.mass, float(mass))
+        self.pos = np.vstack((self.pos, [[posX, posY]]))
+        self.vel = np.vstack((self.vel, [[velX, velY]]))
+        self.radius = np.append(self.radius, float(radius))
+        self.ids = np.append(self.ids, self.ids.max() + 1 if len(self.ids) > 0 else 0)
+        return len(self.mass) - 1
+
+    def remove_bodies(self, indices):
+        keep = np.ones(len(self), dtype=bool)
+        keep[indices] = False
+        self.mass = self.mass[keep]
+        self.pos = self.pos[keep]
+        self.vel = self.vel[keep]
+        self.radius = self.radius[keep]
+        self.ids = self.ids[keep]
+
+    def accelerations(self, pos=None):
+        if pos is None:
+            pos = self.pos
+
+        # integrators often ask for the forces at the positions they just produced
+        # (leapfrog's closing kick, Dormand-Prince's last stage), so the last result is reused
+        settings = (self.G, self.solver, self.theta, self.softening)
+        if self._last_forces is not None:
+            last_pos, last_mass, last_settings, acc = self._last_forces
+            if last_settings == settings and last_pos.shape == pos.shape and np.array_equal(last_pos, pos) and np.array_equal(last_mass, self.mass):
+                profiler.count('force_cache_hits')
+                return acc
+
+        self.force_evaluations += 1
+        profiler.count('force_evaluations')
+        with profiler.phase('forces'):
+            if self.solver == 'barnes_hut':
+                acc = tree_accelerations(pos, self.mass, self.G, self.theta, self.softening)
+            else:
+                acc = direct_accelerations(pos, self.mass, self.G, self.softening)
+        self._last_forces = (pos.copy(), self.mass.copy(), settings, acc)
+        return acc
+
+    def energy(self):
+        kinetic = 0.5 * np.sum(self.mass * np.einsum('ij,ij->i', self.vel, self.vel))
+        return kinetic + potential_energy(self.pos, self.mass, self.G, self.softening)
+
+    def angular_momentum(self):
+        # z component about the origin
+        return np.sum(self.mass * (self.pos[:, 0] * self.vel[:, 1] - self.pos[:, 1] * self.vel[:, 0]))
+
+    def force_error(self, sample=1000, seed=0):
+        # relative error of the Barnes-Hut force against direct summation on a random sample of bodies
+        rng = np.random.default_rng(seed)
+        picked = rng.choice(len(self), size=min(sample, len(self)), replace=False)
+        sources = np.flatnonzero(self.mass)
+
+        tree = tree_accelerations(self.pos, self.mass, self.G, self.theta, self.softening)[picked]
+        exact = field_accelerations(self.pos[picked], self.pos[sources], self.mass[sources], self.G, self.softening)
+
+        scale = np.linalg.norm(exact, axis=1)
+        error = np.linalg.norm(tree - exact, axis=1) / np.where(scale > 0, scale, 1.0)
+        return {
+            'theta': self.theta,
+            'bodies': len(self),
+            'sampled': len(picked),
+            'median': float(np.median(error)),
+            'p99': float(np.percentile(error, 99)),
+            'max': float(error.max()),
+        }
+
+    def kick(self, dt):
+        self.vel += self.accelerations() * dt
+
+    def drift(self, dt):
+        self.pos += self.vel * dt
+
+    def step(self, dt):
+        # same update order as the original per-body loop: velocities first, then positions
+        self.kick(dt)
+        self.drift(dt)
+
+
+class celestial_body:
+    # thin view of one row of an nbody_system, kept for compatibility
+    # set_pos() and set_vel(body) step by dt like the old GUI's module level dt did;
+    # assign celestial_body.dt or pass dt to the call
+    dt = 0
+
+    def __init__(self, mass, posX, posY, velX, velY, system=None):
+        if system is None:
+            system = nbody_system()
+        self.system = system
+        self.index = system.add_body(mass, posX, posY, velX, velY)
+
+    @property
+    def mass(self):
+        return self.system.mass[self.index]
+
+    @mass.setter
+    def mass(self, value):
+        self.system.mass[self.index] = value
+
+    @property
+    def pos(self):
+        return self.system.pos[self.index]
+
+    @pos.setter
+    def pos(self, value):
+        self.system.pos[self.index] = value
+
+    @property
+    def vel(self):
+        return self.system.vel[self.index]
+
+    @vel.setter
+    def vel(self, value):
+        self.system.vel[self.index] = value
+
+    def set_pos(self, dt=None):
+        dt = self.dt if dt is None else dt
+        self.pos += self.vel * dt
+
+    def set_vel(self, celestial_body, dt=None):
+        dt = self.dt if dt is None else dt
+        r = np.linalg.norm(self.pos - celestial_body.pos)
+        acc = (self.system.G * celestial_body.mass) / (r**2)
+        direction = (celestial_body.pos - self.pos) / r
+        acceleration = acc * direction
+        self.vel += acceleration * dt
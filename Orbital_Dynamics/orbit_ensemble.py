@@ -0,0 +1,290 @@
+'''
+Ensemble / parameter sweep runner.
+
+A sweep file perturbs a base scenario. Parameters are addressed by their path in the
+scenario JSON ('G', 'dt', 'bodies.1.vy', 'satellites.0.x', ...) in scenario units:
+
+    {
+        "seed": 0,
+        "samples": 100,
+        "collision_distance": 6371,
+        "parameters": {
+            "G": {"values": [6.6743, 6.7]},
+            "bodies.1.vy": {"normal": 5.0},
+            "bodies.1.mass": {"uniform": [-0.001, 0.001]}
+        }
+    }
+
+'values' lists form a grid, 'normal' (standard deviation) and 'uniform' (low, high) are
+random offsets added to the base value, drawn 'samples' times for every grid point.
+Members that share their step count, time step and body count and use a fixed step
+integrator with direct summation are advanced together as one (members, bodies, 2) array.
+Batches of members are spread over a process pool and each finished batch is appended
+to a JSON lines results file, so an interrupted sweep picks up where it stopped.
+
+Usage:
+    python orbit_ensemble.py scenarios/earth_moon.json sweep.json --results sweep.jsonl
+'''
+
+import argparse
+import copy
+import itertools
+import json
+import os
+import time
+import numpy as np
+from multiprocessing import Pool
+from orbit_sim import simulation
+from orbit_scenario import scenario_from_dict
+from orbit_integrators import make_integrator
+
+# largest body count for which the closest approach is tracked every step
+max_tracked_bodies = 2000
+
+
+def set_path(data, path, value):
+    parts = path.split('.')
+    for part in parts[:-1]:
+        data = data[int(part)] if isinstance(data, list) else data[part]
+    if isinstance(data, list):
+        data[int(parts[-1])] = value
+    else:
+        data[parts[-1]] = value
+
+
+def get_path(data, path, default=None):
+    for part in path.split('.'):
+        try:
+            data = data[int(part)] if isinstance(data, list) else data[part]
+        except (KeyError, IndexError):
+            return default
+    return data
+
+
+def expand_members(base, sweep):
+    # every member is (id, {path: value}); random draws only depend on the seed and the id
+    parameters = sweep.get('parameters', {})
+    grid = [(path, spec['values']) for path, spec in parameters.items() if 'values' in spec]
+    random = [(path, spec) for path, spec in parameters.items() if 'values' not in spec]
+    samples = sweep.get('samples', 1) if random else 1
+    seed = sweep.get('seed', 0)
+
+    members = []
+    for combo in itertools.product(*[values for path, values in grid]):
+        for sample in range(samples):
+            member = len(members)
+            params = {grid[index][0]: combo[index] for index in range(len(grid))}
+            rng = np.random.default_rng([seed, member])
+            for path, spec in random:
+                value = get_path(base, path, 0.0)
+                if 'normal' in spec:
+                    value += rng.normal(0.0, spec['normal'])
+                elif 'uniform' in spec:
+                    value += rng.uniform(spec['uniform'][0], spec['uniform'][1])
+                else:
+                    raise ValueError('unknown perturbation for ' + path)
+                params[path] = float(value)
+            members.append((member, params))
+    return members
+
+
+def batch_accelerations(pos, mass, G):
+    # pos (members, bodies, 2), mass (members, bodies), G (members,)
+    d = pos[:, None, :, :] - pos[:, :, None, :]
+    r2 = np.einsum('mijk,mijk->mij', d, d)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        w = np.where(r2 > 0, mass[:, None, :] / (r2 * np.sqrt(r2)), 0.0)
+    return G[:, None, None] * np.einsum('mij,mijk->mik', w, d)
+
+
+def batch_energy(pos, vel, mass, G):
+    d = pos[:, None, :, :] - pos[:, :, None, :]
+    r = np.sqrt(np.einsum('mijk,mijk->mij', d, d))
+    upper = np.triu(np.ones(r.shape[1:], dtype=bool), 1)
+    with np.errstate(divide='ignore'):
+        w = np.where(upper, 1 / r, 0.0)
+    potential = -G * np.einsum('mi,mij,mj->m', mass, w, mass)
+    kinetic = 0.5 * np.einsum('mi,mik,mik->m', mass, vel, vel)
+    return kinetic + potential
+
+
+def min_separation(pos):
+    # closest distance between any two bodies of each member
+    d = pos[:, None, :, :] - pos[:, :, None, :]
+    r2 = np.einsum('mijk,mijk->mij', d, d)
+    index = np.arange(pos.shape[1])
+    r2[:, index, index] = np.inf
+    return np.sqrt(r2.min(axis=(1, 2)))
+
+
+class ensemble_batch:
+    # several independent systems advanced together, shaped like an nbody_system for the integrators
+    def __init__(self, mass, pos, vel, G):
+        self.mass = mass
+        self.pos = pos
+        self.vel = vel
+        self.G = G
+        self.force_evaluations = 0
+
+    def accelerations(self, pos=None):
+        if pos is None:
+            pos = self.pos
+        self.force_evaluations += 1
+        return batch_accelerations(pos, self.mass, self.G)
+
+
+def summarize(member, params, mass, pos, vel, G, closest, energy_drift, collision_distance, steps):
+    # escape and orbital elements are taken relative to the most massive body
+    primary = int(np.argmax(mass))
+    escaped = []
+    elements = []
+    for index in range(len(mass)):
+        if index == primary:
+            continue
+        r = pos[index] - pos[primary]
+        v = vel[index] - vel[primary]
+        mu = G * (mass[primary] + mass[index])
+        distance = np.linalg.norm(r)
+        energy = 0.5 * np.dot(v, v) - mu / distance
+        ecc = ((np.dot(v, v) - mu / distance) * r - np.dot(r, v) * v) / mu
+        if energy >= 0:
+            escaped.append(index)
+        elements.append({
+            'body': index,
+            'a_km': float(-mu / (2 * energy) / 1000) if energy != 0 else None,
+            'e': float(np.linalg.norm(ecc)),
+        })
+
+    return {
+        'member': member,
+        'params': params,
+        'steps': steps,
+        'escaped': escaped,
+        'collision': bool(closest is not None and closest < collision_distance),
+        'min_separation_km': float(closest / 1000) if closest is not None else None,
+        'energy_drift': float(energy_drift),
+        'elements': elements,
+    }
+
+
+def run_members(task):
+    base, members, collision_distance = task
+    scenarios = []
+    for member, params in members:
+        data = copy.deepcopy(base)
+        for path, value in params.items():
+            set_path(data, path, value)
+        scenarios.append(scenario_from_dict(data))
+
+    system, settings = scenarios[0]
+    batchable = (
+        not make_integrator(settings['integrator']).adaptive
+        and all(s.solver == 'direct' and len(s) == len(system) for s, o in scenarios)
+        and all(o['dt'] == settings['dt'] and o['steps'] == settings['steps'] and o['integrator'] == settings['integrator'] for s, o in scenarios)
+    )
+    if batchable:
+        return run_batch(members, scenarios, collision_distance)
+    return [run_single(member, params, system, settings, collision_distance) for (member, params), (system, settings) in zip(members, scenarios)]
+
+
+def run_batch(members, scenarios, collision_distance):
+    settings = scenarios[0][1]
+    batch = ensemble_batch(
+        np.array([s.mass for s, o in scenarios]),
+        np.array([s.pos for s, o in scenarios]),
+        np.array([s.vel for s, o in scenarios]),
+        np.array([s.G for s, o in scenarios]),
+    )
+    stepper = make_integrator(settings['integrator'])
+    initial = batch_energy(batch.pos, batch.vel, batch.mass, batch.G)
+    closest = min_separation(batch.pos)
+    for i in range(settings['steps']):
+        stepper.step(batch, settings['dt'])
+        closest = np.minimum(closest, min_separation(batch.pos))
+    final = batch_energy(batch.pos, batch.vel, batch.mass, batch.G)
+
+    results = []
+    for index in range(len(members)):
+        member, params = members[index]
+        drift = (final[index] - initial[index]) / abs(initial[index]) if initial[index] != 0 else 0.0
+        results.append(summarize(member, params, batch.mass[index], batch.pos[index], batch.vel[index], batch.G[index], closest[index], drift, collision_distance, settings['steps']))
+    return results
+
+
+def run_single(member, params, system, settings, collision_distance):
+    sim = simulation(system, settings['dt'], settings['integrator'], settings['tol'])
+    tracked = len(system) <= max_tracked_bodies
+    closest = min_separation(system.pos[None])[0] if tracked else None
+    for i in range(settings['steps']):
+        sim.step()
+        if tracked:
+            closest = min(closest, min_separation(system.pos[None])[0])
+    drift = sim.drift()['energy']
+    return summarize(member, params, system.mass, system.pos, system.vel, system.G, closest, drift, collision_distance, settings['steps'])
+
+
+def finished_members(path):
+    # members already in the results file; a torn last line from a killed run is ignored
+    done = set()
+    if not os.path.exists(path):
+        return done
+    with open(path) as file:
+        for line in file:
+            try:
+                done.add(json.loads(line)['member'])
+            except (ValueError, KeyError):
+                pass
+    return done
+
+
+def run_ensemble(base, sweep, results_path, workers=None, batch_size=32):
+    members = expand_members(base, sweep)
+    done = finished_members(results_path)
+    todo = [m for m in members if m[0] not in done]
+    collision_distance = sweep.get('collision_distance', 0.0) * 1000
+
+    tasks = [(base, todo[start:start + batch_size], collision_distance) for start in range(0, len(todo), batch_size)]
+    workers = workers or os.cpu_count() or 1
+
+    with open(results_path, 'a') as out:
+        if workers > 1 and len(tasks) > 1:
+            with Pool(workers) as pool:
+                for results in pool.imap_unordered(run_members, tasks):
+                    write_results(out, results)
+        else:
+            for task in tasks:
+                write_results(out, run_members(task))
+
+    return len(members), len(done), len(todo)
+
+
+def write_results(out, results):
+    for result in results:
+        out.write(json.dumps(result) + '\n')
+    out.flush()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Run a scenario over a sweep of perturbed parameters.')
+    parser.add_argument('scenario', help='base JSON scenario file')
+    parser.add_argument('sweep', help='JSON sweep specification')
+    parser.add_argument('--results', required=True, help='JSON lines file the member summaries are appended to')
+    parser.add_argument('--workers', type=int, help='processes to use (default: all cores)')
+    parser.add_argument('--batch-size', type=int, default=32, help='members per task')
+    parser.add_argument('--restart', action='store_true', help='discard existing results instead of resuming')
+    args = parser.parse_args(argv)
+
+    with open(args.scenario) as file:
+        base = json.load(file)
+    with open(args.sweep) as file:
+        sweep = json.load(file)
+    if args.restart and os.path.exists(args.results):
+        os.remove(args.results)
+
+    t = time.time()
+    total, skipped, ran = run_ensemble(base, sweep, args.results, args.workers, args.batch_size)
+    print('Ran', ran, 'of', total, 'members (' + str(skipped), 'already done) in', round(time.time() - t, 3), 's')
+
+
+if __name__ == '__main__':
+    main()
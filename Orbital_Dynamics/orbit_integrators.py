@@ -0,0 +1,155 @@
+'''
+Time integrators for nbody_system.
+
+Every integrator has a step(system, dt) method that advances the system by exactly dt.
+Fixed step methods take one step of size dt. The adaptive method treats dt as the
+output interval and picks its own internal steps to meet the error tolerance.
+'''
+
+import numpy as np
+
+
+class euler:
+    # semi-implicit Euler, the update the simulator has always used (1st order, 1 force evaluation)
+    adaptive = False
+
+    def step(self, system, dt):
+        system.vel += system.accelerations() * dt
+        system.pos += system.vel * dt
+
+
+class leapfrog:
+    # kick-drift-kick velocity Verlet (2nd order, symplectic)
+    # the closing kick's forces are reused by the next step, so it costs 1 force evaluation per step
+    adaptive = False
+
+    def step(self, system, dt):
+        system.vel += system.accelerations() * (dt / 2)
+        system.pos += system.vel * dt
+        system.vel += system.accelerations() * (dt / 2)
+
+
+class yoshida:
+    # Yoshida's 4th order symplectic composition of leapfrog (3 force evaluations per step)
+    adaptive = False
+
+    w1 = 1 / (2 - 2**(1/3))
+    w0 = -2**(1/3) * w1
+    drifts = (w1 / 2, (w0 + w1) / 2, (w0 + w1) / 2, w1 / 2)
+    kicks = (w1, w0, w1)
+
+    def step(self, system, dt):
+        for index in range(3):
+            system.pos += system.vel * (self.drifts[index] * dt)
+            system.vel += system.accelerations() * (self.kicks[index] * dt)
+        system.pos += system.vel * (self.drifts[3] * dt)
+
+
+class rk4:
+    # classic 4th order Runge-Kutta (4 force evaluations per step, not symplectic)
+    adaptive = False
+
+    def step(self, system, dt):
+        x = system.pos
+        v = system.vel
+
+        a1 = system.accelerations(x)
+        v2 = v + a1 * (dt / 2)
+        a2 = system.accelerations(x + v * (dt / 2))
+        v3 = v + a2 * (dt / 2)
+        a3 = system.accelerations(x + v2 * (dt / 2))
+        v4 = v + a3 * dt
+        a4 = system.accelerations(x + v3 * dt)
+
+        system.pos = x + (v + 2 * v2 + 2 * v3 + v4) * (dt / 6)
+        system.vel = v + (a1 + 2 * a2 + 2 * a3 + a4) * (dt / 6)
+
+
+class dopri5:
+    # Dormand-Prince 5(4) embedded Runge-Kutta with step size control
+    # the last stage is the first stage of the next step, so an accepted step costs 6 force evaluations
+    adaptive = True
+
+    a = (
+        (),
+        (1/5,),
+        (3/40, 9/40),
+        (44/45, -56/15, 32/9),
+        (19372/6561, -25360/2187, 64448/6561, -212/729),
+        (9017/3168, -355/33, 46732/5247, 49/176, -5103/18656),
+        (35/384, 0, 500/1113, 125/192, -2187/6784, 11/84),
+    )
+    # difference between the 5th and 4th order weights
+    e = (71/57600, 0, -71/16695, 71/1920, -17253/339200, 22/525, -1/40)
+
+    def __init__(self, tol=1e-9, h=None):
+        self.tol = tol
+        self.h = h
+        self.rejected = 0
+
+    def error_norm(self, system, x, v, dx, dv, x_new, v_new):
+        # positions and velocities are compared against tol times their size, with the
+        # RMS size of the system as a floor so bodies sitting at the origin are not over-resolved
+        pos_floor = np.sqrt(np.mean(np.sum(x**2, axis=1))) + 1e-300
+        vel_floor = np.sqrt(np.mean(np.sum(v**2, axis=1))) + 1e-300
+        pos_scale = self.tol * (np.maximum(np.abs(x), np.abs(x_new)) + pos_floor)
+        vel_scale = self.tol * (np.maximum(np.abs(v), np.abs(v_new)) + vel_floor)
+        return max(np.max(np.abs(dx) / pos_scale), np.max(np.abs(dv) / vel_scale))
+
+    def attempt(self, system, h):
+        x = system.pos
+        v = system.vel
+        kx = [v]
+        kv = [system.accelerations(x)]
+        for stage in range(1, 7):
+            xs = x.copy()
+            vs = v.copy()
+            for j in range(stage):
+                if self.a[stage][j] != 0:
+                    xs += kx[j] * (self.a[stage][j] * h)
+                    vs += kv[j] * (self.a[stage][j] * h)
+            kx.append(vs)
+            kv.append(system.accelerations(xs))
+
+        # the 7th stage is evaluated at the 5th order solution
+        x_new = xs
+        v_new = vs
+        dx = sum(kx[j] * (self.e[j] * h) for j in range(7) if self.e[j] != 0)
+        dv = sum(kv[j] * (self.e[j] * h) for j in range(7) if self.e[j] != 0)
+        return x_new, v_new, self.error_norm(system, x, v, dx, dv, x_new, v_new)
+
+    def step(self, system, dt):
+        remaining = dt
+        if self.h is None:
+            self.h = dt
+        while remaining > dt * 1e-12:
+            h = min(self.h, remaining)
+            x_new, v_new, err = self.attempt(system, h)
+            factor = 5.0 if err == 0 else min(5.0, max(0.2, 0.9 * err**-0.2))
+            if err <= 1:
+                system.pos = x_new
+                system.vel = v_new
+                remaining -= h
+                # a step shortened to land on the interval end doesn't say anything about the next one
+                if h == self.h or factor < 1:
+                    self.h = h * factor
+            else:
+                self.rejected += 1
+                self.h = h * factor
+
+
+integrators = {
+    'euler': euler,
+    'leapfrog': leapfrog,
+    'yoshida': yoshida,
+    'rk4': rk4,
+    'dopri5': dopri5,
+}
+
+
+def make_integrator(name, tol=1e-9):
+    if name not in integrators:
+        raise ValueError('unknown integrator: ' + str(name))
+    if integrators[name].adaptive:
+        return integrators[name](tol)
+    return integrators[name]()
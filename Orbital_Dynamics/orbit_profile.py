@@ -0,0 +1,165 @@
+'''
+Per-phase timing for the simulation loop.
+
+The shared profiler is off by default and costs one attribute check per phase while off.
+Turned on, every phase keeps a count, total, min, max and a histogram of durations in
+power of two buckets (1 us, 2 us, 4 us, ...), plus named counters. With tracing on, the
+last trace_capacity phases are also kept as Chrome trace events, which chrome://tracing
+or https://ui.perfetto.dev can open:
+
+    from orbit_profile import profiler
+    profiler.enable(trace=True)
+    with profiler.phase('forces'):
+        ...
+    profiler.count('force_evaluations')
+    profiler.export_chrome_trace('run.trace.json')
+'''
+
+import collections
+import json
+import os
+import threading
+import time
+
+# histogram buckets are powers of two nanoseconds starting at 2**10 (about 1 us)
+first_bucket = 10
+buckets = 25
+
+trace_capacity = 200000
+
+
+class phase_stats:
+    __slots__ = ('count', 'total', 'min', 'max', 'histogram')
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = 0
+        self.histogram = [0] * buckets
+
+    def add(self, ns):
+        self.count += 1
+        self.total += ns
+        if self.min is None or ns < self.min:
+            self.min = ns
+        if ns > self.max:
+            self.max = ns
+        self.histogram[min(buckets - 1, max(0, ns.bit_length() - first_bucket))] += 1
+
+    def percentile(self, q):
+        # upper edge of the bucket holding the q-th percentile, in ns
+        target = q / 100 * self.count
+        seen = 0
+        for index in range(buckets):
+            seen += self.histogram[index]
+            if seen >= target and seen > 0:
+                return 2**(index + first_bucket)
+        return 2**(buckets + first_bucket - 1)
+
+
+class _null_phase:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+class _phase:
+    __slots__ = ('profiler', 'name', 'start')
+
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc):
+        self.profiler.record(self.name, self.start, time.perf_counter_ns())
+        return False
+
+
+null_phase = _null_phase()
+
+
+class phase_profiler:
+    def __init__(self, enabled=False, trace=False):
+        self.enabled = enabled
+        self.tracing = trace
+        self.reset()
+
+    def reset(self):
+        self.phases = {}
+        self.counters = collections.Counter()
+        self.events = collections.deque(maxlen=trace_capacity)
+        self.origin = time.perf_counter_ns()
+
+    def enable(self, trace=False):
+        self.enabled = True
+        self.tracing = trace
+
+    def disable(self):
+        self.enabled = False
+        self.tracing = False
+
+    def phase(self, name):
+        if not self.enabled:
+            return null_phase
+        return _phase(self, name)
+
+    def record(self, name, start, end):
+        stats = self.phases.get(name)
+        if stats is None:
+            stats = self.phases.setdefault(name, phase_stats())
+        stats.add(end - start)
+        if self.tracing:
+            self.events.append((name, start, end, threading.get_ident()))
+
+    def count(self, name, n=1):
+        if self.enabled:
+            self.counters[name] += n
+
+    def summary(self):
+        # per-phase figures in milliseconds, plus the counters
+        phases = {}
+        for name, stats in self.phases.items():
+            phases[name] = {
+                'count': stats.count,
+                'total_ms': stats.total / 1e6,
+                'mean_ms': stats.total / stats.count / 1e6,
+                'min_ms': stats.min / 1e6,
+                'max_ms': stats.max / 1e6,
+                'p50_ms': stats.percentile(50) / 1e6,
+                'p99_ms': stats.percentile(99) / 1e6,
+                'histogram': {str(2**(index + first_bucket) // 1000) + 'us': n for index, n in enumerate(stats.histogram) if n > 0},
+            }
+        return {'phases': phases, 'counters': dict(self.counters)}
+
+    def report(self):
+        lines = ['{:<18} {:>8} {:>11} {:>11} {:>11}'.format('phase', 'count', 'mean ms', 'p99 ms', 'total ms')]
+        for name, stats in sorted(self.phases.items(), key=lambda item: -item[1].total):
+            lines.append('{:<18} {:>8} {:>11.3f} {:>11.3f} {:>11.1f}'.format(name, stats.count, stats.total / stats.count / 1e6, stats.percentile(99) / 1e6, stats.total / 1e6))
+        for name, value in sorted(self.counters.items()):
+            lines.append('{:<18} {:>8}'.format(name, value))
+        return '\n'.join(lines)
+
+    def export_chrome_trace(self, path):
+        # complete ('X') events with microsecond timestamps, one track per thread
+        pid = os.getpid()
+        threads = {}
+        events = []
+        for name, start, end, thread in list(self.events):
+            tid = threads.setdefault(thread, len(threads))
+            events.append({'name': name, 'ph': 'X', 'ts': (start - self.origin) / 1000, 'dur': (end - start) / 1000, 'pid': pid, 'tid': tid})
+        for thread, tid in threads.items():
+            name = 'main' if thread == threading.main_thread().ident else 'worker ' + str(tid)
+            events.append({'name': 'thread_name', 'ph': 'M', 'pid': pid, 'tid': tid, 'args': {'name': name}})
+        with open(path, 'w') as file:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms', 'otherData': {'counters': dict(self.counters)}}, file)
+
+
+# shared by the engine, the simulation loop and the GUI
+profiler = phase_profiler()
@@ -0,0 +1,138 @@
+'''
+Chunked binary trajectory files.
+
+Layout: an 8 byte magic string, the header length as a little-endian uint64, a JSON header
+padded to a multiple of 64 bytes, then fixed size frames of float64 values:
+time, positions (N x 2) and velocities (N x 2), all in SI units.
+
+Frames are appended straight to disk in chunks of a few megabytes, so a recording of
+millions of steps never holds more than one chunk in memory. Reading memory-maps the file and hands out views, so
+seeking to any frame is immediate and nothing is copied.
+
+Usage:
+    python orbit_record.py run.traj                 # summary
+    python orbit_record.py run.traj --frame 1000    # state at one frame
+    python orbit_record.py run.traj --export part.npz --start 0 --stop 5000 --every 10
+'''
+
+import argparse
+import json
+import os
+import numpy as np
+
+magic = b'ORBTRAJ1'
+
+# frames are gathered into chunks of about this many bytes before hitting the file
+chunk_bytes = 2**23
+
+
+class trajectory_writer:
+    def __init__(self, path, masses, dt=0.0, G=0.0, record_every=1):
+        self.masses = np.asarray(masses, dtype=float)
+        self.n_bodies = len(self.masses)
+        header = {
+            'n_bodies': self.n_bodies,
+            'masses': self.masses.tolist(),
+            'dt': dt,
+            'G': G,
+            'record_every': record_every,
+            'dtype': '<f8',
+            'frame': ['time', 'pos', 'vel'],
+        }
+        text = json.dumps(header).encode()
+        text += b' ' * (-(len(magic) + 8 + len(text)) % 64)
+
+        self.file = open(path, 'wb')
+        self.file.write(magic)
+        self.file.write(np.uint64(len(text)).astype('<u8').tobytes())
+        self.file.write(text)
+
+        width = 1 + 4 * self.n_bodies
+        self.chunk = np.empty((max(1, chunk_bytes // (width * 8)), width), dtype='<f8')
+        self.pending = 0
+        self.frames = 0
+
+    def write(self, time, pos, vel):
+        if len(pos) != self.n_bodies:
+            raise ValueError('a trajectory file holds a fixed number of bodies')
+        row = self.chunk[self.pending]
+        row[0] = time
+        row[1:1 + 2 * self.n_bodies] = np.ravel(pos)
+        row[1 + 2 * self.n_bodies:] = np.ravel(vel)
+        self.pending += 1
+        self.frames += 1
+        if self.pending == len(self.chunk):
+            self.flush()
+
+    def flush(self):
+        self.file.write(self.chunk[:self.pending].tobytes())
+        self.file.flush()
+        self.pending = 0
+
+    def close(self):
+        if not self.file.closed:
+            self.flush()
+            self.file.close()
+
+
+class trajectory_reader:
+    def __init__(self, path):
+        with open(path, 'rb') as file:
+            if file.read(len(magic)) != magic:
+                raise ValueError(str(path) + ' is not a trajectory file')
+            length = int(np.frombuffer(file.read(8), dtype='<u8')[0])
+            self.header = json.loads(file.read(length))
+
+        self.n_bodies = self.header['n_bodies']
+        self.masses = np.array(self.header['masses'])
+        offset = len(magic) + 8 + length
+        width = 1 + 4 * self.n_bodies
+
+        # a partly written last frame (e.g. from a run that was killed) is ignored
+        n_frames = (os.path.getsize(path) - offset) // (width * 8)
+        if n_frames > 0:
+            self.data = np.memmap(path, dtype='<f8', mode='r', offset=offset, shape=(n_frames, width))
+        else:
+            self.data = np.empty((0, width))
+
+        n = self.n_bodies
+        self.times = self.data[:, 0]
+        self.positions = self.data[:, 1:1 + 2 * n].reshape(n_frames, n, 2)
+        self.velocities = self.data[:, 1 + 2 * n:].reshape(n_frames, n, 2)
+
+    def __len__(self):
+        return len(self.data)
+
+    def frame(self, index):
+        # time and zero-copy views of one frame's positions and velocities
+        return self.times[index], self.positions[index], self.velocities[index]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Inspect or replay a recorded trajectory without re-simulating.')
+    parser.add_argument('trajectory', help='trajectory file written with --record')
+    parser.add_argument('--frame', type=int, help='print the state at this frame (negative counts from the end)')
+    parser.add_argument('--export', help='copy a range of frames into an .npz file')
+    parser.add_argument('--start', type=int, default=0)
+    parser.add_argument('--stop', type=int)
+    parser.add_argument('--every', type=int, default=1)
+    args = parser.parse_args(argv)
+
+    reader = trajectory_reader(args.trajectory)
+    print(len(reader), 'frames of', reader.n_bodies, 'bodies, recorded every', reader.header['record_every'], 'steps')
+    if len(reader) > 0:
+        print('time', reader.times[0], 'to', reader.times[-1], 's')
+
+    if args.frame is not None:
+        time, pos, vel = reader.frame(args.frame)
+        print('Frame', args.frame, 'at time', time, 's')
+        for index in range(reader.n_bodies):
+            print(index, pos[index] / 1000, vel[index])
+
+    if args.export:
+        part = slice(args.start, args.stop, args.every)
+        np.savez(args.export, times=reader.times[part], positions=reader.positions[part], velocities=reader.velocities[part], masses=reader.masses)
+
+
+if __name__ == '__main__':
+    main()
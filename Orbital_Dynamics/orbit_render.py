@@ -0,0 +1,103 @@
+'''
+Blitted drawing of the orbit plot.
+
+One scatter artist is created per scenario and only its offsets change afterwards.
+The static parts of the axes are cached as a background image, so a frame costs a
+restore, two artist draws and a blit instead of a full canvas redraw.
+'''
+
+import numpy as np
+from matplotlib.colors import to_rgba_array
+
+
+class trail_buffer:
+    # fixed size ring buffer of the last few rendered positions
+    def __init__(self, length, n_bodies):
+        self.data = np.zeros((length, n_bodies, 2))
+        self.head = 0
+        self.filled = 0
+
+    def __len__(self):
+        return self.filled
+
+    def push(self, pos):
+        self.data[self.head] = pos
+        self.head = (self.head + 1) % len(self.data)
+        self.filled = min(self.filled + 1, len(self.data))
+
+    def ordered(self):
+        # oldest frame first
+        index = (self.head - self.filled + np.arange(self.filled)) % len(self.data)
+        return self.data[index]
+
+
+class blit_renderer:
+    def __init__(self, canvas, axes):
+        self.canvas = canvas
+        self.axes = axes
+        self.scatter = None
+        self.trail_artist = None
+        self.trails = None
+        self.background = None
+        self.scale = None
+        self.trail_length = 0
+        self.overlay = None
+        self.canvas.mpl_connect('draw_event', self.on_draw)
+
+    def reset(self, pos, colors, scale, trail_length=0):
+        # full redraw, used when the scenario, the scale or the trail length changes
+        self.axes.cla()
+        self.axes.set_xlim(-1 * scale, scale)
+        self.axes.set_ylim(-1 * scale, scale)
+        self.colors = to_rgba_array(colors) if len(colors) > 0 else np.zeros((0, 4))
+
+        self.trails = trail_buffer(trail_length, len(pos)) if trail_length > 0 else None
+        self.trail_artist = self.axes.scatter([], [], s=4, animated=True) if self.trails is not None else None
+        self.scatter = self.axes.scatter(pos[:, 0], pos[:, 1], c=self.colors, animated=True)
+        self.overlay = self.axes.text(0.02, 0.98, '', transform=self.axes.transAxes, va='top', ha='left', family='monospace', fontsize=7, animated=True)
+        self.scale = scale
+        self.trail_length = trail_length
+        self.canvas.draw()
+
+    def on_draw(self, event):
+        # a full draw (first frame, resize, toolbar zoom) refreshes the cached background
+        if self.scatter is None:
+            return
+        self.background = self.canvas.copy_from_bbox(self.axes.bbox)
+        self.draw_artists()
+
+    def draw_artists(self):
+        if self.trail_artist is not None:
+            self.axes.draw_artist(self.trail_artist)
+        self.axes.draw_artist(self.scatter)
+        if self.overlay is not None and self.overlay.get_text():
+            self.axes.draw_artist(self.overlay)
+
+    def set_overlay(self, text):
+        # text drawn over the plot on the next frame, '' hides it
+        if self.overlay is not None:
+            self.overlay.set_text(text)
+
+    def update(self, pos):
+        if self.scatter is None:
+            return
+
+        if self.trails is not None:
+            self.trails.push(pos)
+            frames = self.trails.ordered()
+            # older frames fade out
+            alpha = np.repeat(np.arange(1, len(frames) + 1) / (len(frames) + 1), len(pos))
+            trail_colors = np.tile(self.colors, (len(frames), 1))
+            trail_colors[:, 3] = alpha * 0.6
+            self.trail_artist.set_offsets(frames.reshape(-1, 2))
+            self.trail_artist.set_facecolors(trail_colors)
+            self.trail_artist.set_edgecolors(trail_colors)
+
+        self.scatter.set_offsets(pos)
+
+        if self.background is None:
+            self.canvas.draw()
+            return
+        self.canvas.restore_region(self.background)
+        self.draw_artists()
+        self.canvas.blit(self.axes.bbox)
@@ -0,0 +1,162 @@
+'''
+Bulk propagation of massless test particles (satellites) under a handful of massive bodies.
+
+The massive bodies are integrated once per step and every position at which the integrator
+asked for forces is recorded. The satellites are then replayed through the same integrator
+against that recording, in chunks that can be spread across a process pool. Satellite state
+lives in shared memory so the workers update their chunks in place.
+'''
+
+import numpy as np
+from multiprocessing import Pool, shared_memory
+from orbit_engine import field_accelerations
+from orbit_integrators import make_integrator
+
+# at most this many satellites are advanced together, so the temporaries stay in cache
+chunk_size = 65536
+
+# with a pool the satellites are split into about this many tasks per worker, so a slow
+# worker doesn't hold up the step, but never into tasks of fewer than min_chunk
+chunks_per_worker = 4
+min_chunk = 1024
+
+# steps of massive body motion recorded before the satellites catch up
+segment_steps = 256
+
+
+class force_recorder:
+    # stands in for an nbody_system and records the massive body positions of every force request
+    def __init__(self, system):
+        self.system = system
+        self.tape = []
+
+    @property
+    def pos(self):
+        return self.system.pos
+
+    @pos.setter
+    def pos(self, value):
+        self.system.pos = value
+
+    @property
+    def vel(self):
+        return self.system.vel
+
+    @vel.setter
+    def vel(self, value):
+        self.system.vel = value
+
+    def accelerations(self, pos=None):
+        self.tape.append((self.system.pos if pos is None else pos).copy())
+        return self.system.accelerations(pos)
+
+
+class test_particles:
+    # massless bodies pulled by a recorded sequence of massive body positions
+    def __init__(self, pos, vel, tape, mass, G):
+        self.pos = pos
+        self.vel = vel
+        self.tape = tape
+        self.mass = mass
+        self.G = G
+        self.calls = 0
+
+    def accelerations(self, pos=None):
+        if pos is None:
+            pos = self.pos
+        sources = self.tape[self.calls]
+        self.calls += 1
+        return field_accelerations(pos, sources, self.mass, self.G)
+
+
+def _advance(pos, vel, tape, mass, G, dt, steps, integrator):
+    particles = test_particles(pos, vel, tape, mass, G)
+    stepper = make_integrator(integrator)
+    for i in range(steps):
+        stepper.step(particles, dt)
+    return particles.pos, particles.vel
+
+
+_shared = {}
+
+
+def _attach(pos_name, vel_name, n):
+    # pool initializer, maps the shared satellite arrays into the worker
+    _shared['pos_memory'] = shared_memory.SharedMemory(name=pos_name)
+    _shared['vel_memory'] = shared_memory.SharedMemory(name=vel_name)
+    _shared['pos'] = np.ndarray((n, 2), dtype=float, buffer=_shared['pos_memory'].buf)
+    _shared['vel'] = np.ndarray((n, 2), dtype=float, buffer=_shared['vel_memory'].buf)
+
+
+def _advance_shared(task):
+    start, stop, tape, mass, G, dt, steps, integrator = task
+    pos, vel = _advance(_shared['pos'][start:stop].copy(), _shared['vel'][start:stop].copy(), tape, mass, G, dt, steps, integrator)
+    _shared['pos'][start:stop] = pos
+    _shared['vel'][start:stop] = vel
+
+
+def task_size(n, workers):
+    # satellites per chunk for n satellites over workers processes
+    if workers <= 1:
+        return chunk_size
+    return min(chunk_size, max(min_chunk, -(-n // (workers * chunks_per_worker))))
+
+
+def propagate(system, sat_pos, sat_vel, dt, steps, integrator='leapfrog', workers=1, chunk=None, segment=segment_steps):
+    # advance the massive bodies in system and the satellites together, returns the satellites' final state
+    if make_integrator(integrator).adaptive:
+        raise ValueError('test particles need a fixed step integrator, not ' + str(integrator))
+
+    stepper = make_integrator(integrator)
+    recorder = force_recorder(system)
+    sat_pos = np.array(sat_pos, dtype=float).reshape(-1, 2)
+    sat_vel = np.array(sat_vel, dtype=float).reshape(-1, 2)
+    n = len(sat_pos)
+    chunk = chunk or task_size(n, workers)
+
+    pool = None
+    if workers > 1 and n > chunk:
+        pos_memory = shared_memory.SharedMemory(create=True, size=sat_pos.nbytes)
+        vel_memory = shared_memory.SharedMemory(create=True, size=sat_vel.nbytes)
+        shared_pos = np.ndarray(sat_pos.shape, dtype=float, buffer=pos_memory.buf)
+        shared_vel = np.ndarray(sat_vel.shape, dtype=float, buffer=vel_memory.buf)
+        shared_pos[:] = sat_pos
+        shared_vel[:] = sat_vel
+        pool = Pool(workers, initializer=_attach, initargs=(pos_memory.name, vel_memory.name, n))
+
+    try:
+        done = 0
+        while done < steps:
+            count = min(segment, steps - done)
+            recorder.tape = []
+            for i in range(count):
+                stepper.step(recorder, dt)
+
+            sources = np.flatnonzero(system.mass)
+            tape = np.array(recorder.tape)[:, sources]
+            mass = system.mass[sources]
+
+            if pool is not None:
+                tasks = [(start, min(start + chunk, n), tape, mass, system.G, dt, count, integrator) for start in range(0, n, chunk)]
+                pool.map(_advance_shared, tasks)
+            else:
+                for start in range(0, n, chunk):
+                    pos, vel = _advance(sat_pos[start:start + chunk], sat_vel[start:start + chunk], tape, mass, system.G, dt, count, integrator)
+                    sat_pos[start:start + chunk] = pos
+                    sat_vel[start:start + chunk] = vel
+            done += count
+
+        if pool is not None:
+            sat_pos = shared_pos.copy()
+            sat_vel = shared_vel.copy()
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+            del shared_pos, shared_vel
+            pos_memory.close()
+            pos_memory.unlink()
+            vel_memory.close()
+            vel_memory.unlink()
+
+    return sat_pos, sat_vel
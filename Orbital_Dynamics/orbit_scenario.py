@@ -0,0 +1,225 @@
+'''
+Scenario files in JSON or CSV.
+
+Both formats use the GUI units: dt in days, G in E^-11, positions in km, velocities in m/s,
+masses in earth masses and radii in km. Bodies with zero mass are satellites.
+
+JSON bodies are either a list of objects (the hand written form) or one array per column,
+which is what gets saved and is much faster for large scenarios:
+
+    {"dt": 0.1, "steps": 273,
+     "bodies": {"mass": [1, 0.0123], "x": [0, 384400], "y": [0, 0], "vx": [0, 0], "vy": [-12.6, 1022]},
+     "satellites": [{"x": 42164, "y": 0, "vx": 0, "vy": 3075}]}
+
+CSV files have one body per row under a header naming the columns, and the settings as
+'# key: value' comment lines (values are JSON) above it:
+
+    # dt: 0.1
+    # steps: 273
+    mass,x,y,vx,vy,radius
+    1,0,0,0,-12.6,6371
+    0,42164,0,0,3075,0
+
+Columns are parsed and validated as whole arrays, so loading doesn't loop over bodies.
+'''
+
+import json
+import numpy as np
+from orbit_engine import day, earth_mass, nbody_system
+
+# every column a body can have, in file order; missing mass or radius columns default to 0
+body_columns = ('mass', 'x', 'y', 'vx', 'vy', 'radius')
+required_columns = ('x', 'y', 'vx', 'vy')
+
+settings_defaults = {
+    'dt': 1,
+    'G': 6.67430,
+    'steps': 20,
+    'solver': 'direct',
+    'theta': 0.5,
+    'integrator': 'euler',
+    'tol': 1e-9,
+    'collisions': None,
+}
+
+
+def empty_columns(n=0):
+    return {name: np.zeros(n) for name in body_columns}
+
+
+def table_columns(rows, satellites=False):
+    # a list of body objects or a dict of column arrays, as float arrays
+    if isinstance(rows, dict):
+        lengths = {len(values) for values in rows.values()}
+        if len(lengths) > 1:
+            raise ValueError('scenario columns have different lengths')
+        n = lengths.pop() if lengths else 0
+        unknown = [name for name in rows if name not in body_columns]
+        if unknown:
+            raise ValueError('unknown scenario columns: ' + ', '.join(unknown))
+        missing = [name for name in required_columns if name not in rows]
+        if rows and missing:
+            raise ValueError('scenario is missing the columns: ' + ', '.join(missing))
+        columns = {name: np.asarray(rows.get(name, np.zeros(n)), dtype=float) for name in body_columns}
+    else:
+        missing = [index for index in range(len(rows)) if any(name not in rows[index] for name in required_columns)]
+        if missing:
+            raise ValueError('bodies ' + ', '.join(str(index) for index in missing[:10]) + ' are missing a position or velocity')
+        columns = {name: np.array([row.get(name, 0) for row in rows], dtype=float) for name in body_columns}
+    if satellites:
+        columns['mass'] = np.zeros(len(columns['mass']))
+    return columns
+
+
+def join_columns(first, second):
+    return {name: np.concatenate((first[name], second[name])) for name in body_columns}
+
+
+def validate_columns(columns):
+    problems = []
+    checks = [(name, ~np.isfinite(columns[name]), 'not a finite number') for name in body_columns]
+    checks.append(('mass', columns['mass'] < 0, 'negative'))
+    checks.append(('radius', columns['radius'] < 0, 'negative'))
+    for name, bad, reason in checks:
+        rows = np.flatnonzero(bad)
+        if len(rows) > 0:
+            shown = ', '.join(str(row) for row in rows[:10]) + (' ...' if len(rows) > 10 else '')
+            problems.append(name + ' is ' + reason + ' for ' + str(len(rows)) + ' bodies (' + shown + ')')
+    if problems:
+        raise ValueError('invalid scenario: ' + '; '.join(problems))
+
+
+def columns_from_dict(data):
+    columns = join_columns(table_columns(data.get('bodies', [])), table_columns(data.get('satellites', []), satellites=True))
+    validate_columns(columns)
+    return columns
+
+
+def scenario_settings(data):
+    # settings in scenario units, missing ones filled in with the defaults
+    return {key: data.get(key, default) for key, default in settings_defaults.items()}
+
+
+def si_settings(settings):
+    # scenario units to the SI values the simulation uses; collisions stay in km
+    return {
+        'dt': settings['dt'] * day,
+        'G': settings['G'] * (10**-11),
+        'steps': int(settings['steps']),
+        'solver': settings['solver'],
+        'theta': settings['theta'],
+        'integrator': settings['integrator'],
+        'tol': settings['tol'],
+        'collisions': settings['collisions'],
+    }
+
+
+def system_from_columns(columns, settings):
+    # settings in SI units
+    return nbody_system(
+        columns['mass'] * earth_mass,
+        np.column_stack((columns['x'], columns['y'])) * 1000,
+        np.column_stack((columns['vx'], columns['vy'])),
+        settings['G'], settings['solver'], settings['theta'],
+        columns['radius'] * 1000,
+    )
+
+
+def columns_from_system(system):
+    return {
+        'mass': system.mass / earth_mass,
+        'x': system.pos[:, 0] / 1000,
+        'y': system.pos[:, 1] / 1000,
+        'vx': system.vel[:, 0].copy(),
+        'vy': system.vel[:, 1].copy(),
+        'radius': system.radius / 1000,
+    }
+
+
+def scenario_from_dict(data):
+    # an nbody_system plus its run settings in SI units
+    settings = si_settings(scenario_settings(data))
+    return system_from_columns(columns_from_dict(data), settings), settings
+
+
+def read_scenario(path):
+    # body columns and settings, both in scenario units
+    if str(path).lower().endswith('.csv'):
+        return read_csv(path)
+    with open(path) as file:
+        data = json.load(file)
+    return columns_from_dict(data), scenario_settings(data)
+
+
+def load_scenario(path):
+    columns, settings = read_scenario(path)
+    settings = si_settings(settings)
+    return system_from_columns(columns, settings), settings
+
+
+def read_csv(path):
+    data = {}
+    header = None
+    skip = 0
+    with open(path) as file:
+        for line in file:
+            skip += 1
+            line = line.strip()
+            if line.startswith('#'):
+                key, sep, value = line[1:].partition(':')
+                if sep:
+                    data[key.strip()] = json.loads(value)
+            elif line:
+                header = [name.strip() for name in line.split(',')]
+                break
+
+    if header is None:
+        return empty_columns(), scenario_settings(data)
+    unknown = [name for name in header if name not in body_columns]
+    if unknown:
+        raise ValueError('unknown scenario columns: ' + ', '.join(unknown))
+    missing = [name for name in required_columns if name not in header]
+    if missing:
+        raise ValueError('scenario is missing the columns: ' + ', '.join(missing))
+
+    try:
+        table = np.loadtxt(path, delimiter=',', skiprows=skip, ndmin=2)
+    except ValueError as error:
+        raise ValueError('could not read ' + str(path) + ': ' + str(error))
+    if table.size == 0:
+        table = np.zeros((0, len(header)))
+    if table.shape[1] != len(header):
+        raise ValueError('rows in ' + str(path) + ' do not match the header')
+
+    columns = empty_columns(len(table))
+    for index, name in enumerate(header):
+        columns[name] = table[:, index]
+    validate_columns(columns)
+    return columns, scenario_settings(data)
+
+
+def save_scenario(path, system, settings):
+    # writes the system as it is now, settings in SI units like load_scenario returns them
+    columns = columns_from_system(system)
+    saved = {
+        'dt': settings['dt'] / day,
+        'G': system.G / (10**-11),
+        'steps': settings['steps'],
+        'solver': system.solver,
+        'theta': system.theta,
+        'integrator': settings['integrator'],
+        'tol': settings['tol'],
+    }
+    if settings.get('collisions'):
+        saved['collisions'] = settings['collisions']
+
+    if str(path).lower().endswith('.csv'):
+        header = ''.join('# ' + key + ': ' + json.dumps(value) + '\n' for key, value in saved.items())
+        header += ','.join(body_columns)
+        table = np.column_stack([columns[name] for name in body_columns])
+        np.savetxt(path, table, fmt='%.17g', delimiter=',', header=header, comments='')
+        return
+
+    saved['bodies'] = {name: columns[name].tolist() for name in body_columns}
+    with open(path, 'w') as file:
+        json.dump(saved, file)
@@ -0,0 +1,342 @@
+'''
+Headless orbit simulation core and command line entry point.
+Nothing in here imports tkinter or matplotlib, so it can be used on machines without a display.
+
+Scenario files are JSON or CSV (see orbit_scenario.py) and use the same units as the GUI entries:
+dt in days, G in E^-11, positions in km, velocities in m/s and masses in earth masses.
+Bodies may give a 'radius' in km, and an optional 'collisions' block
+({"policy": "merge", "encounter_distance": 50000, "softening": 0}, distances in km)
+turns on collision and close encounter detection.
+Results are kept in SI units at full precision.
+
+Usage:
+    python orbit_sim.py scenario.json --steps 100000 --output run.npz
+    python orbit_sim.py scenario.json --collisions merge --events events.jsonl
+    python orbit_sim.py scenario.json --checkpoint run.ckpt.npz --checkpoint-every 1000
+    python orbit_sim.py --resume run.ckpt.npz
+'''
+
+import argparse
+import json
+import time
+import numpy as np
+from orbit_engine import day, nbody_system, solvers
+from orbit_integrators import integrators, make_integrator
+from orbit_satellites import propagate
+from orbit_record import trajectory_writer
+from orbit_collisions import collision_monitor, policies
+from orbit_scenario import load_scenario, save_scenario
+from orbit_profile import profiler
+from orbit_checkpoint import save_checkpoint, load_checkpoint
+
+
+class simulation:
+    # drives an nbody_system forward in time
+    # with an adaptive integrator dt is the output interval and the integrator picks its own steps
+    # the energy is an O(N^2) sum, so very large runs can switch the drift diagnostics off
+    # a collision monitor may merge bodies away, outputs keep one slot per starting body (NaN once gone)
+    def __init__(self, system, dt, integrator='euler', tol=1e-9, diagnostics=True, collisions=None):
+        self.system = system
+        self.dt = dt
+        self.integrator = make_integrator(integrator, tol)
+        self.time = 0.0
+        self.steps_taken = 0
+        self.recorder = None
+        self.record_every = 1
+        self.checkpoint_path = None
+        self.checkpoint_every = 0
+        self.checkpoint_settings = None
+        self.collisions = collisions
+        self.stopped = False
+        self.initial_ids = system.ids.copy()
+        if collisions is not None:
+            collisions.attach(system)
+        self.diagnostics = diagnostics
+        if diagnostics:
+            self.initial_energy = system.energy()
+            self.initial_angular_momentum = system.angular_momentum()
+
+    def step(self):
+        # the phases nest inside 'step', forces are timed inside 'integrate' by the system
+        with profiler.phase('step'):
+            with profiler.phase('integrate'):
+                self.integrator.step(self.system, self.dt)
+            self.time += self.dt
+            self.steps_taken += 1
+            profiler.count('steps')
+            if self.collisions is not None:
+                with profiler.phase('collisions'):
+                    self.collisions.check(self.system, self.time, self.steps_taken)
+                self.stopped = self.collisions.stopped
+            if self.recorder is not None and self.steps_taken % self.record_every == 0:
+                with profiler.phase('record'):
+                    self.recorder.write(self.time, *self.full_state())
+            if self.checkpoint_path is not None and self.steps_taken % self.checkpoint_every == 0:
+                with profiler.phase('checkpoint'):
+                    save_checkpoint(self.checkpoint_path, self, self.checkpoint_settings)
+
+    def full_state(self):
+        # positions and velocities with one row per starting body, NaN for bodies merged away
+        if len(self.system) == len(self.initial_ids):
+            return self.system.pos, self.system.vel
+        slots = np.searchsorted(self.initial_ids, self.system.ids)
+        pos = np.full((len(self.initial_ids), 2), np.nan)
+        vel = np.full((len(self.initial_ids), 2), np.nan)
+        pos[slots] = self.system.pos
+        vel[slots] = self.system.vel
+        return pos, vel
+
+    def full_masses(self):
+        # masses lined up with full_state, NaN for bodies merged away
+        if len(self.system) == len(self.initial_ids):
+            return self.system.mass
+        masses = np.full(len(self.initial_ids), np.nan)
+        masses[np.searchsorted(self.initial_ids, self.system.ids)] = self.system.mass
+        return masses
+
+    def record(self, path, every=1):
+        # stream every Nth state to a trajectory file, starting with the current one
+        # frames keep one row per starting body, so bodies merged before this are NaN
+        self.stop_recording()
+        self.recorder = trajectory_writer(path, self.full_masses(), self.dt, self.system.G, every)
+        self.record_every = every
+        self.recorder.write(self.time, *self.full_state())
+
+    def checkpoint(self, path, every, settings=None):
+        # replace the checkpoint at path every Nth step, settings are saved alongside for resuming
+        self.checkpoint_path = path
+        self.checkpoint_every = max(1, every)
+        self.checkpoint_settings = settings
+
+    def stop_recording(self):
+        if self.recorder is not None:
+            self.recorder.close()
+            self.recorder = None
+
+    def drift(self):
+        # relative change in total energy and angular momentum since the start of the run
+        if not self.diagnostics:
+            return {'force_evaluations': self.system.force_evaluations}
+        energy = self.system.energy()
+        angular_momentum = self.system.angular_momentum()
+        return {
+            'energy': float((energy - self.initial_energy) / abs(self.initial_energy)) if self.initial_energy != 0 else 0.0,
+            'angular_momentum': float((angular_momentum - self.initial_angular_momentum) / abs(self.initial_angular_momentum)) if self.initial_angular_momentum != 0 else 0.0,
+            'force_evaluations': self.system.force_evaluations,
+        }
+
+    def run(self, steps, sample_every=1):
+        # returns the sampled times, positions and velocities, including the initial state
+        # with sample_every=0 only the final state is returned
+        # a run stopped by a collision is cut short after its last sample, which is taken even
+        # off the sample_every grid, so there is room for one more
+        samples = steps // sample_every + 2 if sample_every > 0 else 1
+        times = np.empty(samples)
+        positions = np.empty((samples, len(self.initial_ids), 2))
+        velocities = np.empty((samples, len(self.initial_ids), 2))
+
+        times[0] = self.time
+        positions[0], velocities[0] = self.full_state()
+        sample = 1
+        for i in range(1, steps + 1):
+            self.step()
+            if sample_every > 0 and (i % sample_every == 0 or self.stopped):
+                times[sample] = self.time
+                positions[sample], velocities[sample] = self.full_state()
+                sample += 1
+            if self.stopped:
+                break
+
+        if sample_every <= 0:
+            times[0] = self.time
+            positions[0], velocities[0] = self.full_state()
+            sample = 1
+
+        return times[:sample], positions[:sample], velocities[:sample]
+
+
+def simulate(masses, positions, velocities, dt, G, steps, sample_every=1, integrator='euler', tol=1e-9):
+    # SI units throughout: kg, m, m/s, seconds
+    system = nbody_system(masses, positions, velocities, G)
+    return simulation(system, dt, integrator, tol).run(steps, sample_every)
+
+
+def resume(path):
+    # a simulation exactly as it was when the checkpoint was written, plus its run settings
+    system, monitor, meta = load_checkpoint(path)
+    # the energy sums are skipped here and the saved starting values put back instead
+    sim = simulation(system, meta['dt'], meta['integrator'], diagnostics=False, collisions=monitor)
+    vars(sim.integrator).update(meta['integrator_state'])
+    sim.diagnostics = meta['diagnostics']
+    sim.initial_energy = meta['initial_energy']
+    sim.initial_angular_momentum = meta['initial_angular_momentum']
+    sim.time = meta['time']
+    sim.steps_taken = meta['steps_taken']
+    sim.stopped = meta['stopped']
+    sim.initial_ids = meta['initial_ids']
+    return sim, meta['settings']
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Run an orbit simulation without the GUI.')
+    parser.add_argument('scenario', nargs='?', help='JSON or CSV scenario file')
+    parser.add_argument('--resume', help='carry on from this checkpoint instead of a scenario (see orbit_checkpoint.py)')
+    parser.add_argument('--checkpoint', help='keep an exact checkpoint of the run in this .npz file')
+    parser.add_argument('--checkpoint-every', type=int, help='steps between checkpoints (default 1000)')
+    parser.add_argument('--steps', type=int, help='number of steps, overrides the scenario (a resumed run counts the steps it already took)')
+    parser.add_argument('--dt', type=float, help='time step in days, overrides the scenario')
+    parser.add_argument('--sample-every', type=int, default=1, help='keep every Nth step in the output (0 keeps only the final state)')
+    parser.add_argument('--solver', choices=solvers, help='force solver, overrides the scenario')
+    parser.add_argument('--theta', type=float, help='Barnes-Hut opening angle, overrides the scenario')
+    parser.add_argument('--integrator', choices=sorted(integrators), help='time integrator, overrides the scenario')
+    parser.add_argument('--tol', type=float, help='error tolerance for the adaptive integrator, overrides the scenario')
+    parser.add_argument('--no-diagnostics', action='store_true', help="skip the energy and angular momentum drift report (it is O(N^2))")
+    parser.add_argument('--force-error', action='store_true', help='report the Barnes-Hut force error against direct summation before running')
+    parser.add_argument('--collisions', choices=policies, help='what to do when bodies touch (needs body radii), overrides the scenario')
+    parser.add_argument('--encounter-distance', type=float, help='log pairs that come closer than this many km')
+    parser.add_argument('--softening', type=float, help="softening length in km for the 'soften' policy")
+    parser.add_argument('--events', help='write the encounter and collision log to this JSON lines file')
+    parser.add_argument('--record', help='stream the run to this trajectory file (see orbit_record.py)')
+    parser.add_argument('--record-every', type=int, default=1, help='record every Nth step')
+    parser.add_argument('--satellite-workers', type=int, help='propagate the satellites in bulk, split across this many processes')
+    parser.add_argument('--output', help='write times, positions, velocities, masses and body ids to this .npz file')
+    parser.add_argument('--profile', action='store_true', help='time each phase of the step loop and print a breakdown')
+    parser.add_argument('--trace', help='also write the phase timings to this Chrome trace-event JSON file')
+    parser.add_argument('--save', help='write the final state as a scenario file (.json or .csv) to continue from later')
+    args = parser.parse_args(argv)
+
+    # the bulk satellite path only propagates, none of the step loop features run there
+    if args.satellite_workers:
+        unsupported = [flag for flag, value in (('--resume', args.resume), ('--collisions', args.collisions), ('--encounter-distance', args.encounter_distance),
+                                                ('--softening', args.softening), ('--events', args.events), ('--record', args.record),
+                                                ('--checkpoint', args.checkpoint), ('--profile', args.profile), ('--trace', args.trace)) if value]
+        if unsupported:
+            parser.error('--satellite-workers cannot be combined with ' + ', '.join(unsupported))
+
+    if args.resume is not None:
+        sim, settings = resume(args.resume)
+        if args.steps is not None:
+            settings['steps'] = args.steps
+    elif args.scenario is not None:
+        sim, settings = start_run(args)
+        if sim is None:
+            return
+    else:
+        parser.error('give a scenario file or --resume')
+    system = sim.system
+    monitor = sim.collisions
+
+    # a resumed run keeps checkpointing to the file it came from
+    if args.checkpoint or args.resume:
+        settings['checkpoint_every'] = args.checkpoint_every or settings.get('checkpoint_every', 1000)
+        sim.checkpoint(args.checkpoint or args.resume, settings['checkpoint_every'], settings)
+
+    if args.profile or args.trace:
+        profiler.reset()
+        profiler.enable(trace=args.trace is not None)
+
+    t = time.time()
+    if args.record:
+        sim.record(args.record, args.record_every)
+    try:
+        # steps counts from the start of the run, so a resumed run only does what is left
+        times, positions, velocities = sim.run(max(0, settings['steps'] - sim.steps_taken), args.sample_every)
+    finally:
+        sim.stop_recording()
+    elapsed = time.time() - t
+
+    if args.output:
+        # one row per starting body, ids says which body each row is
+        np.savez(args.output, times=times, positions=positions, velocities=velocities, masses=sim.full_masses(), ids=sim.initial_ids)
+
+    print('Simulated', sim.steps_taken, 'steps of', len(system), 'bodies in', round(elapsed, 3), 's')
+    print('Drift:', sim.drift())
+    if monitor is not None:
+        print('Events:', len(monitor.events), '(run stopped by a collision)' if sim.stopped else '')
+        for event in monitor.events[:20]:
+            print(' ', event)
+        if args.events:
+            with open(args.events, 'w') as file:
+                for event in monitor.events:
+                    file.write(json.dumps(event) + '\n')
+    if args.save:
+        save_scenario(args.save, system, settings)
+    if profiler.enabled:
+        print(profiler.report())
+        if args.trace:
+            profiler.export_chrome_trace(args.trace)
+    print_state(system)
+
+
+def start_run(args):
+    # a fresh simulation from the scenario file with the command line overrides applied
+    system, settings = load_scenario(args.scenario)
+    if args.steps is not None:
+        settings['steps'] = args.steps
+    if args.dt is not None:
+        settings['dt'] = args.dt * day
+    if args.solver is not None:
+        system.solver = args.solver
+    if args.theta is not None:
+        system.theta = args.theta
+    if args.integrator is not None:
+        settings['integrator'] = args.integrator
+    if args.tol is not None:
+        settings['tol'] = args.tol
+
+    if args.force_error:
+        print('Force error:', system.force_error())
+
+    if args.satellite_workers:
+        run_satellites(system, settings, args)
+        return None, settings
+
+    # collision settings in the scenario are in km like everything else
+    collisions = dict(settings['collisions'] or {})
+    if args.collisions is not None:
+        collisions['policy'] = args.collisions
+    if args.encounter_distance is not None:
+        collisions['encounter_distance'] = args.encounter_distance
+    if args.softening is not None:
+        collisions['softening'] = args.softening
+    monitor = None
+    if collisions:
+        monitor = collision_monitor(collisions.get('policy', 'none'), collisions.get('encounter_distance', 0) * 1000, collisions.get('softening', 0) * 1000)
+
+    sim = simulation(system, settings['dt'], settings['integrator'], settings['tol'], not args.no_diagnostics, monitor)
+    return sim, settings
+
+
+def print_state(system, limit=50):
+    for index in range(min(len(system), limit)):
+        print(index, system.pos[index] / 1000, system.vel[index])
+    if len(system) > limit:
+        print('...', len(system) - limit, 'more bodies')
+
+
+def run_satellites(system, settings, args):
+    # massive bodies are integrated once, the satellites are replayed against them in chunks
+    massive = system.mass > 0
+    planets = nbody_system(system.mass[massive], system.pos[massive], system.vel[massive], system.G, system.solver, system.theta)
+
+    t = time.time()
+    sat_pos, sat_vel = propagate(planets, system.pos[~massive], system.vel[~massive], settings['dt'], settings['steps'], settings['integrator'], args.satellite_workers)
+    elapsed = time.time() - t
+
+    system.pos[massive] = planets.pos
+    system.vel[massive] = planets.vel
+    system.pos[~massive] = sat_pos
+    system.vel[~massive] = sat_vel
+
+    if args.output:
+        np.savez(args.output, times=np.array([settings['steps'] * settings['dt']]), positions=system.pos[None], velocities=system.vel[None], masses=system.mass, ids=system.ids)
+
+    if args.save:
+        save_scenario(args.save, system, settings)
+
+    print('Simulated', settings['steps'], 'steps of', len(planets), 'bodies and', len(sat_pos), 'satellites in', round(elapsed, 3), 's')
+    print_state(system)
+
+
+if __name__ == '__main__':
+    main()
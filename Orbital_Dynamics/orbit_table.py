@@ -0,0 +1,147 @@
+'''
+Paginated body table for the orbit GUI.
+
+The bodies live in NumPy columns in scenario units (km, m/s, earth masses). Only one page
+of Entry widgets is ever built and paging just rewrites their text, so the GUI stays
+responsive with thousands of bodies. Blank cells are kept as NaN, and rows with a blank
+cell are left out when the system is built.
+'''
+
+from tkinter import *
+import numpy as np
+from orbit_scenario import body_columns, empty_columns
+
+column_labels = {
+    'x': 'X (km)',
+    'y': 'Y (km)',
+    'vx': 'VX (m/s)',
+    'vy': 'VY (m/s)',
+    'mass': 'Mass (M_E)',
+    'radius': 'R (km)',
+}
+
+
+class body_table:
+    def __init__(self, master, columns, rows=10, width=9, decimals=None):
+        # columns are the body_columns shown, the others stay 0 for every row
+        self.columns = columns
+        self.data = empty_columns()
+        self.rows = rows
+        self.page = 0
+        self.decimals = decimals or {}
+
+        self.frame = Frame(master)
+        self.frame.pack(side=TOP, fill=X)
+
+        Label(self.frame, text='#').grid(row=0, column=0)
+        for column, name in enumerate(columns):
+            Label(self.frame, text=column_labels[name]).grid(row=0, column=column + 1)
+
+        self.row_labels = []
+        self.entries = []
+        self.shown = []
+        for row in range(rows):
+            label = Label(self.frame, text='', width=5, anchor='e')
+            label.grid(row=row + 1, column=0)
+            self.row_labels.append(label)
+            entries = []
+            for column in range(len(columns)):
+                entry = Entry(self.frame, width=width)
+                entry.grid(row=row + 1, column=column + 1)
+                entry.bind('<FocusOut>', lambda event, row=row, column=column: self.commit_cell(row, column))
+                entry.bind('<Return>', lambda event, row=row, column=column: self.commit_cell(row, column))
+                entries.append(entry)
+            self.entries.append(entries)
+            self.shown.append([''] * len(columns))
+
+        self.nav_frame = Frame(master)
+        self.nav_frame.pack(side=TOP)
+        self.prev_button = Button(self.nav_frame, text='<', command=self.prev_page)
+        self.page_label = Label(self.nav_frame, text='', width=16)
+        self.next_button = Button(self.nav_frame, text='>', command=self.next_page)
+        self.prev_button.pack(side=LEFT)
+        self.page_label.pack(side=LEFT)
+        self.next_button.pack(side=LEFT)
+        self.show()
+
+    def __len__(self):
+        return len(self.data['x'])
+
+    def pages(self):
+        return max(1, -(-len(self) // self.rows))
+
+    def set_data(self, columns):
+        self.data = {name: np.array(columns[name], dtype=float) for name in body_columns}
+        self.page = 0
+        self.show()
+
+    def add_row(self):
+        # a blank row on the last page, radius defaults to 0 like the other hidden values
+        self.commit()
+        for name in body_columns:
+            blank = np.nan if name in self.columns and name != 'radius' else 0.0
+            self.data[name] = np.append(self.data[name], blank)
+        self.page = self.pages() - 1
+        self.show()
+
+    def complete_rows(self):
+        # indices of rows with every shown cell filled in
+        filled = np.ones(len(self), dtype=bool)
+        for name in self.columns:
+            filled &= np.isfinite(self.data[name])
+        return np.flatnonzero(filled)
+
+    def format(self, name, value):
+        if not np.isfinite(value):
+            return ''
+        if name in self.decimals:
+            return str(round(float(value), self.decimals[name]))
+        return '%.6g' % value
+
+    def show(self):
+        # only the visible page is written into widgets
+        first = self.page * self.rows
+        for row in range(self.rows):
+            index = first + row
+            self.row_labels[row].config(text=str(index) if index < len(self) else '')
+            for column, name in enumerate(self.columns):
+                entry = self.entries[row][column]
+                text = self.format(name, self.data[name][index]) if index < len(self) else ''
+                entry.config(state=NORMAL)
+                entry.delete(0, END)
+                entry.insert(0, text)
+                if index >= len(self):
+                    entry.config(state=DISABLED)
+                self.shown[row][column] = text
+        self.page_label.config(text='Page ' + str(self.page + 1) + ' of ' + str(self.pages()) + ' (' + str(len(self)) + ')')
+
+    def commit_cell(self, row, column):
+        # unchanged cells keep their full precision value instead of the rounded text
+        index = self.page * self.rows + row
+        text = self.entries[row][column].get().strip()
+        if index >= len(self) or text == self.shown[row][column]:
+            return
+        name = self.columns[column]
+        try:
+            value = float(text) if text != '' else np.nan
+        except ValueError:
+            value = self.data[name][index]
+        self.data[name][index] = value
+        self.shown[row][column] = self.format(name, value)
+        self.entries[row][column].delete(0, END)
+        self.entries[row][column].insert(0, self.shown[row][column])
+
+    def commit(self):
+        for row in range(self.rows):
+            for column in range(len(self.columns)):
+                self.commit_cell(row, column)
+
+    def prev_page(self):
+        self.commit()
+        self.page = max(0, self.page - 1)
+        self.show()
+
+    def next_page(self):
+        self.commit()
+        self.page = min(self.pages() - 1, self.page + 1)
+        self.show()
@@ -0,0 +1,179 @@
+'''
+Barnes-Hut quadtree gravity for large body counts.
+
+The tree is rebuilt from scratch every force evaluation. Bodies are sorted along a
+Morton (Z-order) curve so every node owns a contiguous slice of the sorted arrays,
+which lets each level of the tree be built and walked with whole-array operations.
+'''
+
+import numpy as np
+
+max_depth = 21
+leaf_size = 8
+
+# number of targets walked through the tree together, bounds the size of the frontier
+target_block = 4096
+
+
+def _spread_bits(v):
+    # insert a zero bit between each of the low 32 bits of v
+    v = v.astype(np.uint64)
+    v = (v | (v << np.uint64(16))) & np.uint64(0x0000FFFF0000FFFF)
+    v = (v | (v << np.uint64(8))) & np.uint64(0x00FF00FF00FF00FF)
+    v = (v | (v << np.uint64(4))) & np.uint64(0x0F0F0F0F0F0F0F0F)
+    v = (v | (v << np.uint64(2))) & np.uint64(0x3333333333333333)
+    v = (v | (v << np.uint64(1))) & np.uint64(0x5555555555555555)
+    return v
+
+
+def _expand(owner, start, count):
+    # pair each owner with every index in [start, start + count)
+    first = np.cumsum(count) - count
+    offsets = np.arange(count.sum()) - np.repeat(first, count)
+    return np.repeat(owner, count), np.repeat(start, count) + offsets
+
+
+class quadtree:
+    def __init__(self, pos, mass):
+        lo = pos.min(axis=0)
+        width = float((pos.max(axis=0) - lo).max()) * (1 + 1e-9)
+        if width == 0:
+            width = 1.0
+
+        # morton code of every body at the deepest level
+        cells = 2**max_depth
+        ij = np.minimum(((pos - lo) / width * cells).astype(np.int64), cells - 1)
+        code = _spread_bits(ij[:, 0]) | (_spread_bits(ij[:, 1]) << np.uint64(1))
+
+        self.order = np.argsort(code, kind='stable')
+        code = code[self.order]
+        ij = ij[self.order]
+        self.pos = pos[self.order]
+        self.mass = mass[self.order]
+        self.width = width
+
+        # level 0 is the root node holding every body
+        starts = [np.array([0])]
+        counts = [np.array([len(code)])]
+        levels = [np.array([0])]
+        parents = [np.array([-1])]
+        n_nodes = 1
+        level_first = 0
+
+        for level in range(1, max_depth + 1):
+            split = np.flatnonzero(counts[-1] > leaf_size)
+            if len(split) == 0:
+                break
+
+            owner, idx = _expand(split, starts[-1][split], counts[-1][split])
+            key = code[idx] >> np.uint64(2 * (max_depth - level))
+            boundary = np.flatnonzero(np.r_[True, (key[1:] != key[:-1]) | (owner[1:] != owner[:-1])])
+
+            starts.append(idx[boundary])
+            counts.append(np.diff(np.r_[boundary, len(idx)]))
+            levels.append(np.full(len(boundary), level))
+            parents.append(owner[boundary] + level_first)
+
+            level_first = n_nodes
+            n_nodes += len(boundary)
+
+        self.start = np.concatenate(starts)
+        self.count = np.concatenate(counts)
+        level = np.concatenate(levels)
+        self.size = width / 2.0**level
+        parent = np.concatenate(parents)
+
+        # children of a node are stored next to each other, one level down
+        self.child_count = np.bincount(parent[1:], minlength=n_nodes)
+        self.child_start = np.zeros(n_nodes, dtype=np.int64)
+        has_children = self.child_count > 0
+        self.child_start[has_children] = np.searchsorted(parent[1:], np.flatnonzero(has_children)) + 1
+
+        # mass and centre of mass of each node from running sums over the sorted bodies
+        end = self.start + self.count
+        cum_mass = np.r_[0.0, np.cumsum(self.mass)]
+        cum_moment = np.vstack(([0.0, 0.0], np.cumsum(self.mass[:, None] * self.pos, axis=0)))
+        self.node_mass = cum_mass[end] - cum_mass[self.start]
+        self.com = (cum_moment[end] - cum_moment[self.start]) / self.node_mass[:, None]
+
+        # offset of the centre of mass from the middle of its cell, used by the opening test
+        corner = ij[self.start] >> (max_depth - level)[:, None]
+        centre = lo + (corner + 0.5) * self.size[:, None]
+        self.offset = np.linalg.norm(self.com - centre, axis=1)
+
+    def __len__(self):
+        return len(self.start)
+
+    def accelerations(self, targets, G, theta, target_ids=None, softening=0.0):
+        # target_ids gives the index of each target among the tree bodies (or -1) so it skips itself
+        rank = np.empty(len(self.order), dtype=np.int64)
+        rank[self.order] = np.arange(len(self.order))
+        if target_ids is None:
+            self_index = np.full(len(targets), -1)
+        else:
+            self_index = np.where(target_ids >= 0, rank[np.maximum(target_ids, 0)], -1)
+
+        # a node is used as a point mass when it is further than size / theta plus
+        # the offset of its centre of mass, so theta = 0 reduces to direct summation
+        with np.errstate(divide='ignore'):
+            open2 = (self.size / theta + self.offset)**2
+
+        eps2 = softening**2
+        acc = np.zeros((len(targets), 2))
+        for first in range(0, len(targets), target_block):
+            tpos = targets[first:first + target_block]
+            tself = self_index[first:first + target_block]
+            block_acc = np.zeros((len(tpos), 2))
+
+            body = np.arange(len(tpos))
+            node = np.zeros(len(tpos), dtype=np.int64)
+            while len(body) > 0:
+                d = self.com[node] - tpos[body]
+                r2 = np.einsum('ij,ij->i', d, d)
+                far = r2 > open2[node]
+
+                # well separated nodes act as a single point mass
+                r2s = r2[far] + eps2
+                w = self.node_mass[node[far]] / (r2s * np.sqrt(r2s))
+                block_acc[:, 0] += np.bincount(body[far], w * d[far, 0], minlength=len(tpos))
+                block_acc[:, 1] += np.bincount(body[far], w * d[far, 1], minlength=len(tpos))
+
+                # nearby leaves are summed body by body
+                near = ~far
+                leaf = near & (self.child_count[node] == 0)
+                pair_body, source = _expand(body[leaf], self.start[node[leaf]], self.count[node[leaf]])
+                keep = source != tself[pair_body]
+                pair_body = pair_body[keep]
+                source = source[keep]
+                d = self.pos[source] - tpos[pair_body]
+                r2 = np.einsum('ij,ij->i', d, d)
+                r2s = r2 + eps2
+                with np.errstate(divide='ignore'):
+                    w = np.where(r2 > 0, self.mass[source] / (r2s * np.sqrt(r2s)), 0.0)
+                block_acc[:, 0] += np.bincount(pair_body, w * d[:, 0], minlength=len(tpos))
+                block_acc[:, 1] += np.bincount(pair_body, w * d[:, 1], minlength=len(tpos))
+
+                # everything else is opened
+                opened = near & ~leaf
+                body, node = _expand(body[opened], self.child_start[node[opened]], self.child_count[node[opened]])
+
+            acc[first:first + target_block] = block_acc
+
+        return acc * G
+
+
+def tree_accelerations(pos, mass, G, theta, softening=0.0):
+    # Barnes-Hut counterpart of orbit_engine.direct_accelerations
+    acc = np.zeros_like(pos)
+    sources = np.flatnonzero(mass)
+    if len(sources) == 0:
+        return acc
+
+    target_ids = np.full(len(mass), -1)
+    target_ids[sources] = np.arange(len(sources))
+
+    tree = quadtree(pos[sources], mass[sources])
+    # walk the targets in tree order so neighbouring targets share most of their path
+    order = np.r_[sources[tree.order], np.flatnonzero(mass == 0)]
+    acc[order] = tree.accelerations(pos[order], G, theta, target_ids[order], softening)
+    return acc
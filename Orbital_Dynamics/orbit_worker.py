@@ -0,0 +1,99 @@
+'''
+Background worker that steps a simulation off the Tk main thread.
+
+The worker is a thread: the expensive parts of a step are NumPy kernels that release
+the GIL, so physics overlaps with drawing while still sharing the simulation object.
+Snapshots go to the GUI through a small bounded queue. When the GUI falls behind the
+oldest snapshot is dropped, so it always draws the freshest state.
+'''
+
+import queue
+import threading
+import time
+
+
+class snapshot:
+    def __init__(self, time, steps_taken, pos, vel):
+        self.time = time
+        self.steps_taken = steps_taken
+        self.pos = pos
+        self.vel = vel
+
+
+class simulation_worker(threading.Thread):
+    def __init__(self, sim, steps, snapshot_every=1, queue_size=2):
+        super().__init__(daemon=True)
+        self.sim = sim
+        self.steps = steps
+        self.snapshot_every = max(1, snapshot_every)
+        self.snapshots = queue.Queue(maxsize=queue_size)
+        self.dropped = 0
+        self.steps_per_second = 0.0
+        self.error = None
+        self._running = threading.Event()
+        self._running.set()
+        self._cancelled = threading.Event()
+
+    def run(self):
+        window_start = time.perf_counter()
+        window_steps = 0
+        try:
+            for i in range(1, self.steps + 1):
+                self._running.wait()
+                if self._cancelled.is_set():
+                    break
+
+                self.sim.step()
+                window_steps += 1
+
+                # rate over roughly half second windows
+                now = time.perf_counter()
+                if now - window_start >= 0.5:
+                    self.steps_per_second = window_steps / (now - window_start)
+                    window_start = now
+                    window_steps = 0
+
+                if i % self.snapshot_every == 0 or i == self.steps or self.sim.stopped:
+                    self.publish()
+                if self.sim.stopped:
+                    break
+        except Exception as error:
+            self.error = error
+
+    def publish(self):
+        # one row per starting body, so merges don't change the shape of what gets drawn
+        pos, vel = self.sim.full_state()
+        frame = snapshot(self.sim.time, self.sim.steps_taken, pos.copy(), vel.copy())
+        try:
+            self.snapshots.put_nowait(frame)
+        except queue.Full:
+            # drop the stalest frame to make room
+            try:
+                self.snapshots.get_nowait()
+                self.dropped += 1
+            except queue.Empty:
+                pass
+            self.snapshots.put_nowait(frame)
+
+    def latest(self):
+        # newest waiting snapshot, or None
+        frame = None
+        while True:
+            try:
+                frame = self.snapshots.get_nowait()
+            except queue.Empty:
+                return frame
+
+    @property
+    def paused(self):
+        return not self._running.is_set()
+
+    def pause(self):
+        self._running.clear()
+
+    def resume(self):
+        self._running.set()
+
+    def cancel(self):
+        self._cancelled.set()
+        self._running.set()
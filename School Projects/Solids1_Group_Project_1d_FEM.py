@@ -3,15 +3,32 @@ This code is a 1 dimensional Finite Element Modelling GUI.
 The inputs are length, area, and modulus of elasticity of 1 or more materials.
 The outputs are the displacements of the beam when the given forces are applied.
 All deformation is assumed to be elastic.
+The solver lives in fem_solver.py, which also runs models from files without the GUI.
+Large models are loaded from CSV, JSON or .npy files instead of typed in, and the
+results are shown a page at a time and can be saved in bulk.
+With varying sections on, each element frame is a segment whose area, E and distributed
+load can be expressions in x, and the mesh is refined automatically (see fem_refine.py).
 
 Created as a project for Solids 1 at TCU
 Authors: Elliott Miles, Johnathan Bajuk, Spencer Moller, and Evan Evangelista
 '''
 
 import math as m
+import os
 from tkinter import *
+from tkinter import filedialog
 import numpy as np
-import sigfig
+from fem_solver import incremental_bar, dense_stiffness, wall_reaction, read_model, write_nodes, format_values, format_rows
+from fem_refine import segment, refine, write_refined
+
+# the dense spring matrix is only printed for models up to this many nodes
+print_matrix_nodes = 13
+
+# models up to this many elements get entry boxes, bigger ones have to be loaded from a file
+edit_max_elements = 200
+
+# nodes shown per page of results
+result_rows = 20
 
 class FEM_GUI:
     def __init__(self, master):
@@ -43,6 +60,28 @@ class FEM_GUI:
         self.generate_inputs_button = Button(self.top_frame, text='Ready', command=self.generate_inputs)
         self.generate_inputs_button.pack(pady=5)
 
+        self.file_frame = Frame(self.top_frame)
+        self.file_frame.pack()
+        self.load_button = Button(self.file_frame, text='Load Model', command=self.load_model)
+        self.save_button = Button(self.file_frame, text='Save Results', command=self.save_results)
+        self.load_button.grid(row=0, column=0, padx=5)
+        self.save_button.grid(row=0, column=1, padx=5)
+
+        self.print_matrix_var = IntVar(value=0)
+        self.print_matrix_check = Checkbutton(self.top_frame, text='Print spring matrix', variable=self.print_matrix_var)
+        self.print_matrix_check.pack()
+
+        self.varying_var = IntVar(value=0)
+        self.varying_check = Checkbutton(self.top_frame, text='Varying sections (A, E and q as functions of x, refined automatically)', variable=self.varying_var, command=self.set_mode)
+        self.varying_check.pack()
+        self.tol_frame = Frame(self.top_frame)
+        self.tol_frame.pack()
+        self.tol_label = Label(self.tol_frame, text='Displacement tolerance (m):')
+        self.tol_entry = Entry(self.tol_frame, width=8)
+        self.tol_entry.insert(0, '1e-9')
+        self.tol_label.grid(row=0, column=0)
+        self.tol_entry.grid(row=0, column=1)
+
         # input frame widgets
         self.fem_general_inputs = Frame(self.fem_inputs_frame)
         self.fem_general_inputs.pack()
@@ -51,8 +90,40 @@ class FEM_GUI:
         self.answer_button = Button(self.output_frame, text='Calculate', command=self.calculate_nodes)
         self.answer_button.pack()
 
+        self.summary_label = Label(self.output_frame, text='', justify=LEFT)
+        self.summary_label.pack()
+
+        # only one page of results is ever put in the window, whatever the model size
         self.answer_frame = Frame(self.output_frame)
         self.answer_frame.pack()
+        self.answer_text = Text(self.answer_frame, height=result_rows + 1, width=46, state=DISABLED)
+        self.answer_text.pack()
+
+        self.page_frame = Frame(self.output_frame)
+        self.page_frame.pack(pady=5)
+        self.prev_button = Button(self.page_frame, text='<', command=self.prev_page)
+        self.page_label = Label(self.page_frame, text='', width=22)
+        self.next_button = Button(self.page_frame, text='>', command=self.next_page)
+        self.goto_label = Label(self.page_frame, text='Node:')
+        self.goto_entry = Entry(self.page_frame, width=9)
+        self.goto_entry.bind('<Return>', lambda event: self.goto_node())
+        self.prev_button.grid(row=0, column=0)
+        self.page_label.grid(row=0, column=1)
+        self.next_button.grid(row=0, column=2)
+        self.goto_label.grid(row=0, column=3, padx=(10,0))
+        self.goto_entry.grid(row=0, column=4)
+
+        # the last solved model, kept so changing one element doesn't need a full solve
+        self.model = None
+        # a model loaded from a file that is too big for entry boxes
+        self.file_model = None
+        # the last refined varying section model
+        self.refined = None
+        # displacement (and position, for refined models) of every node from the last Calculate, and the page shown
+        self.results = None
+        self.positions = None
+        self.page = 0
+        self.show_page()
 
     def generate_inputs(self):
         # try to convert the value in the nodes count box to an integer
@@ -63,22 +134,52 @@ class FEM_GUI:
         except:
             nodes_count = self.nodes_count_entry.get()
 
-        # if the value was converted to an integer, it generates the correct number of element frames and output frames
-        if isinstance(nodes_count, int) and nodes_count >= 0 and element_count <= 12:
-            # destroy the frames that are already there
-            for widget in self.fem_general_inputs.winfo_children():
-                widget.destroy()
+        # if the value was converted to an integer, it generates the correct number of element frames
+        if isinstance(nodes_count, int) and nodes_count >= 0:
+            if element_count > edit_max_elements:
+                print('Models over ' + str(edit_max_elements) + ' elements have to be loaded from a file (Load Model)')
+                return
+            self.clear_model()
+
             # create the new ones
             for index in range(element_count):
                 self.create_element_frame(index)
 
-            # destroy the frames that are already there
-            for widget in self.answer_frame.winfo_children():
-                widget.destroy()
-            # create the new ones
-            for index in range(nodes_count):
-                self.create_answer_frame(index)
-            
+    def clear_model(self):
+        # forget the last model and its results and destroy the element frames
+        self.model = None
+        self.file_model = None
+        self.refined = None
+        self.set_outputs(None)
+        for widget in self.fem_general_inputs.winfo_children():
+            widget.destroy()
+
+    def load_model(self):
+        path = filedialog.askopenfilename(filetypes=[('Bar models', '*.csv *.json *.npy'), ('All files', '*')])
+        if not path:
+            return
+        try:
+            model = read_model(path)
+        except (OSError, ValueError) as error:
+            print('Failed:', error)
+            return
+        self.clear_model()
+        elements = len(model['area'])
+        self.nodes_count_entry.delete(0, END)
+        self.nodes_count_entry.insert(0, str(elements + 1))
+
+        if elements > edit_max_elements:
+            # too many for entry boxes, Calculate uses the loaded columns directly
+            self.file_model = model
+            Label(self.fem_general_inputs, text='Loaded ' + str(elements) + ' elements from ' + os.path.basename(path)).pack(pady=10)
+            return
+
+        # small models go into the entry boxes so they can be edited like typed in ones
+        texts = {name: [str(value) for value in model[name].tolist()] for name in ('area', 'E', 'length', 'force')}
+        for index in range(elements):
+            widgets = self.create_element_frame(index).winfo_children()
+            for widget, name in zip((widgets[1], widgets[3], widgets[5], widgets[7]), ('area', 'E', 'length', 'force')):
+                widget.insert(0, texts[name][index])
 
     def create_element_frame(self, frame_num):
         # helper function for generate_inputs
@@ -109,88 +210,196 @@ class FEM_GUI:
         force_label.grid(row=0, column=6, pady=5)
         force_entry.grid(row=0, column=7, padx=2, pady=5)
 
-    def create_answer_frame(self, frame_num):
-        # helper function for generate_inputs
-
-        # create label frame for a displacement value
-        node_frame = LabelFrame(self.answer_frame, text='Delta for Node ' + str(frame_num + 1) + ' (m)')
-        row = m.floor(frame_num/8)
-        column = frame_num - row*8
-        node_frame.grid(row=row, column=column, padx=5, pady=5)
-        
-        # create a label to enter the answer into
-        answer = Label(node_frame, text='')
-        answer.pack(padx=3)
+        # distributed load, only shown for varying sections
+        load_label = Label(element_frame, text='q (N/m):')
+        load_entry = Entry(element_frame, width=6)
+        if self.varying_var.get():
+            element_frame.config(text='Segment ' + str(frame_num+1))
+            load_label.grid(row=0, column=8, pady=5)
+            load_entry.grid(row=0, column=9, padx=2, pady=5)
+        return element_frame
+
+    def set_mode(self):
+        # switch the element frames between uniform elements and varying segments
+        varying = self.varying_var.get()
+        self.model = None
+        self.refined = None
+        for index, frame in enumerate(self.fem_general_inputs.winfo_children()):
+            if not isinstance(frame, LabelFrame):
+                continue
+            widgets = frame.winfo_children()
+            frame.config(text=('Segment ' if varying else 'Element ') + str(index+1))
+            if varying:
+                widgets[8].grid(row=0, column=8, pady=5)
+                widgets[9].grid(row=0, column=9, padx=2, pady=5)
+            else:
+                widgets[8].grid_remove()
+                widgets[9].grid_remove()
 
     def calculate_nodes(self):
-        # initialize necessary lists
-        areas = []
-        MoEs = []
-        lengths = []
-        list_of_k = []
-        forces = []
+        if self.varying_var.get() and self.file_model is None:
+            self.calculate_refined()
+            return
+        self.refined = None
+
+        if self.file_model is not None:
+            # a loaded model is used as it is, whole columns at a time
+            areas = self.file_model['area']
+            MoEs = self.file_model['E']*(10**9)
+            lengths = self.file_model['length']
+            forces = self.file_model['force']
+        else:
+            # initialize necessary lists
+            areas = []
+            MoEs = []
+            lengths = []
+            forces = []
+
+            # populate lists with data for each element
+            for frame in self.fem_general_inputs.winfo_children():
+                widgets = frame.winfo_children()
+                areas.append(float(widgets[1].get()))
+                MoEs.append(float(widgets[3].get())*(10**9))
+                lengths.append(float(widgets[5].get()))
+                forces.append(float(widgets[7].get()))
 
         # get the number of nodes
-        num_of_nodes = int(len(self.answer_frame.winfo_children()))
-
-        # initialize sizes of spring and force matrices
-        spring_matrix = np.zeros((num_of_nodes, num_of_nodes))
-        force_vector = np.zeros((num_of_nodes-1,1))
-
-        # populate lists with data for each element
-        for frame in self.fem_general_inputs.winfo_children():
-            widgets = frame.winfo_children()
-            areas.append(float(widgets[1].get()))
-            MoEs.append(float(widgets[3].get())*(10**9))
-            lengths.append(float(widgets[5].get()))
-            forces.append(float(widgets[7].get()))
-
-        # calculate k for each element and add it to a list
-        for index in range(len(self.fem_general_inputs.winfo_children())):
-            k = areas[index] * MoEs[index] / lengths[index]
-            list_of_k.append(k)
-            force_vector[index,0] = forces[index]
-
-        # create spring matrix
-        for index in range(len(list_of_k)):
-            temp_matrix = np.zeros((num_of_nodes, num_of_nodes))
-            temp_matrix[index,index] = list_of_k[index]
-            temp_matrix[index,index+1] = list_of_k[index] * -1
-            temp_matrix[index+1,index] = list_of_k[index] * -1
-            temp_matrix[index+1,index+1] = list_of_k[index]
-
-            spring_matrix += temp_matrix
-
-        # display spring matrix
-        print('Spring Matrix:\n\n' + str(spring_matrix))
-        print()
-        print('Reaction at wall:\n\n' + str(sum(force_vector)[0] * -1))
+        num_of_nodes = len(areas) + 1
+        force_vector = np.array(forces, dtype=float)
+
+        # if only one element's area or E changed since the last Calculate, the last solution is
+        # updated in place, otherwise the model is solved again
+        # the cut spring matrix is tridiagonal, so either way it is solved in O(n) without inverting it (see fem_solver.py)
+        model = self.model
+        changed = None
+        if model is not None and len(model) == len(areas) and np.array_equal(model.lengths, lengths):
+            changed = np.flatnonzero((model.areas != areas) | (model.moduli != MoEs))
+        if changed is not None and len(changed) <= 1:
+            # same bar: a new load case is re-solved on the current stiffnesses
+            if not np.array_equal(model.forces, force_vector):
+                model.set_forces(force_vector)
+            for index in changed:
+                model.update(index, area=areas[index], modulus=MoEs[index])
+        else:
+            model = self.model = incremental_bar(areas, MoEs, lengths, force_vector)
+        list_of_k = model.stiffness
+
+        # display spring matrix, it is only built when asked for and the model is small enough to read
+        if self.print_matrix_var.get():
+            if num_of_nodes <= print_matrix_nodes:
+                print('Spring Matrix:\n\n' + str(dense_stiffness(list_of_k)))
+            else:
+                print('Spring Matrix: not printed for models over ' + str(print_matrix_nodes) + ' nodes')
+            print()
+        reaction = wall_reaction(force_vector)
+        print('Reaction at wall:\n\n' + str(reaction))
         print()
 
-        # cut spring matrix
-        spring_matrix = np.array(spring_matrix[1:,1:])
-
-        # inverse spring matrix
-        spring_inv = np.linalg.inv(spring_matrix)
-
-        # calculate displacements
-        displacements = np.matmul(spring_inv, force_vector)
-
         # display the displacement values
-        self.set_outputs(displacements)
+        self.set_outputs(model.node_displacements(), reaction)
 
-    def set_outputs(self, displacements):
-        displacement_frames = self.answer_frame.winfo_children()
-
-        # set the value of the label in each frame to the corresponding value in the matrix
-        for index in range(len(self.answer_frame.winfo_children())):
-            if index == 0:
-                # the first on is always 0
-                displacement_frames[index].winfo_children()[0].config(text='0')
+    def calculate_refined(self):
+        # every frame is a segment; area, E and q may be expressions in x (m from the segment start)
+        try:
+            tol = float(self.tol_entry.get())
+            segments = []
+            for frame in self.fem_general_inputs.winfo_children():
+                widgets = frame.winfo_children()
+                segments.append(segment(widgets[5].get(), widgets[1].get(), widgets[3].get(), widgets[9].get() or 0.0, widgets[7].get() or 0.0))
+            result = refine(segments, tol)
+        except (ValueError, AttributeError) as error:
+            print('Failed:', error)
+            return
+        self.model = None
+        self.refined = result
+
+        if self.print_matrix_var.get():
+            if len(result) + 1 <= print_matrix_nodes:
+                print('Spring Matrix:\n\n' + str(dense_stiffness(result.stiffness)))
             else:
-                displacement_frames[index].winfo_children()[0].config(text=sigfig.round(displacements[index-1][0], sigfigs=6))
+                print('Spring Matrix: not printed for models over ' + str(print_matrix_nodes) + ' nodes')
+            print()
+        print('Reaction at wall:\n\n' + str(result.reaction))
+        print()
 
-root = Tk()
-root.title("FEM Simulator")
-window = FEM_GUI(root)
-root.mainloop()
\ No newline at end of file
+        self.set_outputs(result.displacements, result.reaction, result.x)
+        converged = 'estimated error ' + format_values([result.error])[0] + ' m'
+        if result.error > tol:
+            converged += ' (not converged, element limit reached)'
+        self.summary_label.config(text=self.summary_label.cget('text') + '\nElements after refinement: ' + str(len(result)) + '    ' + converged)
+
+    def set_outputs(self, displacements, reaction=0.0, positions=None):
+        # a summary of the whole model plus the first page of node displacements
+        self.results = displacements
+        self.positions = positions
+        self.page = 0
+        if displacements is None or len(displacements) == 0:
+            self.summary_label.config(text='')
+        else:
+            largest = int(np.argmax(np.abs(displacements)))
+            reaction_text, tip_text, largest_text = format_values([reaction, displacements[-1], displacements[largest]])
+            self.summary_label.config(text='Nodes: ' + str(len(displacements)) + '    Reaction at wall: ' + reaction_text + ' N\n'
+                                      + 'Tip displacement: ' + tip_text + ' m    Largest: ' + largest_text + ' m at node ' + str(largest + 1))
+        self.show_page()
+
+    def pages(self):
+        if self.results is None:
+            return 1
+        return max(1, -(-len(self.results) // result_rows))
+
+    def show_page(self):
+        # only the rows of the current page are formatted
+        text = ''
+        if self.results is not None:
+            first = self.page * result_rows
+            shown = self.results[first:first + result_rows]
+            nodes = np.arange(first + 1, first + len(shown) + 1)
+            if self.positions is None:
+                text = '{:>8}  {:>20}\n'.format('Node', 'Delta (m)') + format_rows(np.column_stack((nodes, shown)), '%8d  %20.6g')
+            else:
+                positions = self.positions[first:first + result_rows]
+                text = '{:>8}  {:>12}  {:>20}\n'.format('Node', 'x (m)', 'Delta (m)') + format_rows(np.column_stack((nodes, positions, shown)), '%8d  %12.6g  %20.6g')
+        self.answer_text.config(state=NORMAL)
+        self.answer_text.delete('1.0', END)
+        self.answer_text.insert('1.0', text)
+        self.answer_text.config(state=DISABLED)
+        self.page_label.config(text='Page ' + str(self.page + 1) + ' of ' + str(self.pages()))
+
+    def prev_page(self):
+        self.page = max(0, self.page - 1)
+        self.show_page()
+
+    def next_page(self):
+        self.page = min(self.pages() - 1, self.page + 1)
+        self.show_page()
+
+    def goto_node(self):
+        # jump to the page holding the node number typed in
+        try:
+            node = int(self.goto_entry.get())
+        except ValueError:
+            return
+        self.page = min(self.pages() - 1, max(0, (node - 1) // result_rows))
+        self.show_page()
+
+    def save_results(self):
+        if self.model is None and self.refined is None:
+            print('Nothing to save yet, press Calculate first')
+            return
+        path = filedialog.asksaveasfilename(defaultextension='.csv', filetypes=[('CSV', '*.csv'), ('NumPy array', '*.npy')])
+        if not path:
+            return
+        try:
+            if self.refined is not None:
+                write_refined(path, self.refined)
+            else:
+                write_nodes(path, self.model.node_displacements(), self.model.carried)
+        except OSError as error:
+            print('Failed:', error)
+
+# the solver itself is in fem_solver.py and can be used without this window
+if __name__ == '__main__':
+    root = Tk()
+    root.title("FEM Simulator")
+    window = FEM_GUI(root)
+    root.mainloop()
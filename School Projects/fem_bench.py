@@ -0,0 +1,207 @@
+'''
+Headless benchmark and accuracy suite for the bar solver.
+
+Every case generates a seeded random bar model and times the two halves of a solve
+separately: assembly (element stiffnesses and the factorization) and the solve itself.
+Each half is repeated until it has enough runs or its time budget is used up, then one
+more untimed pass runs under tracemalloc for the peak memory. Accuracy is recorded as
+the relative residual |K u - F| / |F| computed from the bands and as the normwise
+backward error |K u - F| / (|K| |u| + |F|), which is what --max-residual checks. Up to
+dense_max_nodes nodes the old GUI path (dense spring matrix, np.linalg.inv, matrix
+product) is timed as well, and the largest difference between the two solutions is
+recorded.
+
+Results are JSON and can be compared against an earlier run; the comparison exits
+non-zero when a case gets slower by more than the threshold, and any run exits non-zero
+when a backward error is above --max-residual.
+
+Usage:
+    python fem_bench.py --output fem_bench.json
+    python fem_bench.py --quick --compare fem_bench.json --threshold 0.15
+    python fem_bench.py --elements 1000 10000000
+'''
+
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+import numpy as np
+from fem_solver import backward_error, bar_factorization, dense_max_nodes, dense_stiffness, element_stiffness, residual
+
+default_elements = (2, 10, 100, 1000, 10000, 100000, 1000000, 10000000)
+quick_elements = (2, 10, 100, 1000, 10000, 100000)
+
+
+def bar_model(elements, seed=0):
+    # steel to aluminium bars of mixed sizes, loads in both directions (SI units, E in Pa)
+    rng = np.random.default_rng(seed)
+    areas = rng.uniform(1e-4, 1e-2, elements)
+    moduli = rng.uniform(70e9, 210e9, elements)
+    lengths = rng.uniform(0.1, 2.0, elements)
+    forces = rng.normal(0.0, 1e3, elements)
+    return areas, moduli, lengths, forces
+
+
+def time_runs(run, min_runs, max_runs, budget):
+    # seconds per run, after one untimed warm up run
+    result = run()
+    times = []
+    start = time.perf_counter()
+    while len(times) < max_runs:
+        t = time.perf_counter()
+        result = run()
+        times.append(time.perf_counter() - t)
+        if len(times) >= min_runs and time.perf_counter() - start >= budget:
+            break
+    return np.array(times), result
+
+
+def timing(times):
+    return {
+        'runs': len(times),
+        'median_ms': 1000 * float(np.median(times)),
+        'min_ms': 1000 * float(times.min()),
+        'max_ms': 1000 * float(times.max()),
+    }
+
+
+def peak_memory(run):
+    # peak bytes allocated while run executes (NumPy reports its buffers to tracemalloc)
+    tracemalloc.start()
+    try:
+        run()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def relative_residual(k, displacements, forces):
+    return float(np.linalg.norm(residual(k, displacements, forces)) / np.linalg.norm(forces))
+
+
+def dense_solve(k, forces):
+    # what calculate_nodes used to do: the full spring matrix with the wall row and column cut, inverted
+    return np.linalg.inv(dense_stiffness(k)[1:, 1:]) @ forces
+
+
+def bench_bar(elements, seed=0, min_runs=3, max_runs=1000, budget=1.0):
+    areas, moduli, lengths, forces = bar_model(elements, seed)
+
+    def assemble():
+        return bar_factorization(element_stiffness(areas, moduli, lengths))
+
+    assembly_times, factorization = time_runs(assemble, min_runs, max_runs, budget)
+    solve_times, displacements = time_runs(lambda: factorization.solve(forces), min_runs, max_runs, budget)
+    total = float(np.median(assembly_times) + np.median(solve_times))
+
+    result = {
+        'name': 'bar/n=' + str(elements),
+        'elements': elements,
+        'assembly': timing(assembly_times),
+        'solve': timing(solve_times),
+        'elements_per_second': elements / total if total > 0 else None,
+        'peak_memory_bytes': peak_memory(lambda: assemble().solve(forces)),
+        'relative_residual': relative_residual(factorization.stiffness, displacements, forces),
+        'backward_error': backward_error(factorization.stiffness, displacements, forces),
+        'dense': None,
+    }
+
+    if elements + 1 <= dense_max_nodes:
+        k = factorization.stiffness
+        dense_times, dense_displacements = time_runs(lambda: dense_solve(k, forces), min_runs, max_runs, budget)
+        result['dense'] = {
+            'solve': timing(dense_times),
+            'peak_memory_bytes': peak_memory(lambda: dense_solve(k, forces)),
+            'relative_residual': relative_residual(k, dense_displacements, forces),
+            'backward_error': backward_error(k, dense_displacements, forces),
+            'max_relative_difference': float(np.abs(dense_displacements - displacements).max() / np.abs(displacements).max()),
+            'speedup': float(np.median(dense_times)) / total if total > 0 else None,
+        }
+    return result
+
+
+def environment():
+    return {
+        'python': sys.version.split()[0],
+        'numpy': np.__version__,
+        'platform': platform.platform(),
+        'processor': platform.processor() or platform.machine(),
+        'cpu_count': os.cpu_count(),
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+    }
+
+
+def log_case(result, log):
+    if log is None:
+        return
+    line = '{:<16} assembly {:>10.3f} ms  solve {:>10.3f} ms  peak {:>9.1f} MB  residual {:.1e}  backward {:.1e}'.format(
+        result['name'], result['assembly']['median_ms'], result['solve']['median_ms'], result['peak_memory_bytes'] / 2**20, result['relative_residual'], result['backward_error'])
+    if result['dense'] is not None:
+        dense = result['dense']
+        line += '  dense {:>10.3f} ms (x{:.0f}) backward {:.1e} diff {:.1e}'.format(dense['solve']['median_ms'], dense['speedup'], dense['backward_error'], dense['max_relative_difference'])
+    log(line)
+
+
+def compare(results, baseline, threshold):
+    # cases slower than the baseline by more than threshold (a fraction), as (name, old, new)
+    old = {case['name']: case['elements_per_second'] for case in baseline['cases']}
+    regressions = []
+    for case in results['cases']:
+        if case['name'] in old and old[case['name']] and case['elements_per_second'] < old[case['name']] * (1 - threshold):
+            regressions.append((case['name'], old[case['name']], case['elements_per_second']))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the bar solver without the GUI.')
+    parser.add_argument('--elements', type=int, nargs='+', help='element counts (default: 2 to 10^7)')
+    parser.add_argument('--budget', type=float, default=1.0, help='seconds to spend timing each part of a case (at least 3 runs are always timed)')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--quick', action='store_true', help='only up to 10^5 elements')
+    parser.add_argument('--max-residual', type=float, default=1e-12, help='largest backward error accepted')
+    parser.add_argument('--output', help='write the results to this JSON file')
+    parser.add_argument('--compare', help='baseline JSON from an earlier run')
+    parser.add_argument('--threshold', type=float, default=0.1, help='allowed throughput drop against the baseline, as a fraction')
+    args = parser.parse_args(argv)
+
+    elements = args.elements or (quick_elements if args.quick else default_elements)
+    cases = []
+    for n in elements:
+        result = bench_bar(n, args.seed, budget=args.budget)
+        log_case(result, print)
+        cases.append(result)
+
+    results = {
+        'environment': environment(),
+        'settings': {'budget': args.budget, 'seed': args.seed},
+        'cases': cases,
+    }
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(results, file, indent=1)
+
+    failed = False
+    inaccurate = [case for case in cases if not case['backward_error'] <= args.max_residual]
+    for case in inaccurate:
+        print('INACCURATE', case['name'], 'backward error', '%.2e' % case['backward_error'], '>', '%.0e' % args.max_residual)
+        failed = True
+
+    if args.compare:
+        with open(args.compare) as file:
+            baseline = json.load(file)
+        regressions = compare(results, baseline, args.threshold)
+        for name, old, new in regressions:
+            print('REGRESSION', name, '%.4g' % old, '->', '%.4g' % new, 'elements/s', '(' + str(round(100 * (new / old - 1), 1)) + '%)')
+        if regressions:
+            failed = True
+        else:
+            print('No case slower than the baseline by more than', str(round(100 * args.threshold)) + '%')
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
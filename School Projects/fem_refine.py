@@ -0,0 +1,301 @@
+'''
+Adaptive mesh refinement for bars whose section, modulus and load vary along them.
+
+Instead of one uniform spring per typed element, the bar is made of segments, each with
+its own length, area A(x) (m^2), modulus E(x) (GPa), distributed load q(x) (N/m) and a
+point force (N) at its far end, like the GUI's element force. A(x), E(x) and q(x) are
+numbers or expressions in x, the distance in m from the start of the segment. L is the
+segment length, and + - * / **, comparisons, pi and the NumPy functions sin, exp, sqrt,
+where, ... can be used. Expressions are parsed and checked against that list, never
+passed to eval, so a model file can't run code:
+
+    {
+        "segments": [
+            {"length": 2.0, "area": "0.01 * (1 - 0.4 * x / L)", "E": 200, "load": "500 * x"},
+            {"length": 1.0, "area": 0.004, "E": "70 + 10 * sin(pi * x)", "load": 0, "force": 1000}
+        ]
+    }
+
+Elements are linear bar elements: k = (1/h^2) * integral of E A and the consistent
+loads integral of q N_i, both by Gauss quadrature. The stiffness keeps the same
+tridiagonal K = B^T diag(k) B structure as hand-typed models, so every mesh is solved
+by fem_solver in O(n).
+
+The bar is statically determinate, so the force carried at the far end of an element is
+the same on any mesh, and the element's stretch can be recomputed on its two halves
+without solving anything else. The difference between the two (scaled for the h^2
+convergence of linear elements) is the element's error indicator, and a node's
+displacement error is at most about the sum of the indicators between it and the wall.
+Elements are bisected (largest indicators first, until the marked ones hold half of the
+total) until that sum is below the tolerance, so elements are only added where A, E or q
+change quickly.
+
+Usage:
+    python fem_refine.py tapered.json --tol 1e-9
+    python fem_refine.py tapered.json --tol 1e-9 --output tapered_result.csv
+'''
+
+import argparse
+import ast
+import json
+import numpy as np
+from fem_solver import bar_factorization, element_forces, write_table
+
+# Gauss points per element
+gauss_order = 4
+
+# share of the total error indicator marked for bisection in each pass
+mark_fraction = 0.5
+
+segment_fields = ('length', 'area', 'E', 'load', 'force')
+
+# functions and constants usable in A(x), E(x) and q(x) expressions
+expression_functions = {name: getattr(np, name) for name in ('sin', 'cos', 'tan', 'exp', 'log', 'sqrt', 'abs', 'minimum', 'maximum', 'where')}
+expression_constants = {'pi': np.pi}
+
+binary_operators = {ast.Add: np.add, ast.Sub: np.subtract, ast.Mult: np.multiply, ast.Div: np.true_divide, ast.Pow: np.power}
+unary_operators = {ast.UAdd: np.positive, ast.USub: np.negative}
+comparisons = {ast.Lt: np.less, ast.LtE: np.less_equal, ast.Gt: np.greater, ast.GtE: np.greater_equal}
+
+
+def check_expression(node, text, name):
+    # only numbers, x, L, pi, arithmetic, single comparisons and calls to expression_functions;
+    # anything else (attributes, subscripts, other names, keywords, ...) is refused before running
+    if isinstance(node, ast.Expression):
+        return check_expression(node.body, text, name)
+    if isinstance(node, ast.Constant) and type(node.value) in (int, float):
+        return
+    if isinstance(node, ast.Name) and node.id in ('x', 'L') + tuple(expression_constants):
+        return
+    if isinstance(node, ast.BinOp) and type(node.op) in binary_operators:
+        check_expression(node.left, text, name)
+        return check_expression(node.right, text, name)
+    if isinstance(node, ast.UnaryOp) and type(node.op) in unary_operators:
+        return check_expression(node.operand, text, name)
+    if isinstance(node, ast.Compare) and len(node.ops) == 1 and type(node.ops[0]) in comparisons:
+        check_expression(node.left, text, name)
+        return check_expression(node.comparators[0], text, name)
+    if isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and node.func.id in expression_functions and not node.keywords:
+        for argument in node.args:
+            check_expression(argument, text, name)
+        return
+    raise ValueError('the ' + name + ' expression ' + repr(text) + ' can only use numbers, x, L, pi, + - * / **, comparisons and ' + ', '.join(expression_functions))
+
+
+def evaluate_expression(node, names):
+    # walks a checked expression tree, nothing is passed to eval
+    if isinstance(node, ast.Expression):
+        return evaluate_expression(node.body, names)
+    if isinstance(node, ast.Constant):
+        return float(node.value)
+    if isinstance(node, ast.Name):
+        return names[node.id]
+    if isinstance(node, ast.BinOp):
+        return binary_operators[type(node.op)](evaluate_expression(node.left, names), evaluate_expression(node.right, names))
+    if isinstance(node, ast.UnaryOp):
+        return unary_operators[type(node.op)](evaluate_expression(node.operand, names))
+    if isinstance(node, ast.Compare):
+        return comparisons[type(node.ops[0])](evaluate_expression(node.left, names), evaluate_expression(node.comparators[0], names))
+    return expression_functions[node.func.id](*[evaluate_expression(argument, names) for argument in node.args])
+
+
+def segment_function(value, name):
+    # a number, an expression string in x (and L) or a callable f(x, L), as f(x, L) -> array
+    if callable(value):
+        return value
+    if isinstance(value, str):
+        text = value
+        try:
+            tree = ast.parse(text.strip(), mode='eval')
+            check_expression(tree, text, name)
+        except (SyntaxError, RecursionError):
+            raise ValueError('cannot read the ' + name + ' expression ' + repr(text))
+
+        def evaluate(x, L):
+            names = dict(expression_constants, x=x, L=L)
+            try:
+                with np.errstate(all='ignore'):
+                    value = evaluate_expression(tree, names)
+            except (TypeError, ValueError, ArithmeticError, RecursionError) as error:
+                raise ValueError('cannot evaluate the ' + name + ' expression ' + repr(text) + ': ' + str(error))
+            return np.broadcast_to(np.asarray(value, dtype=float), np.shape(x))
+        return evaluate
+    constant = float(value)
+    return lambda x, L: np.full(np.shape(x), constant)
+
+
+class segment:
+    def __init__(self, length, area, E, load=0.0, force=0.0):
+        self.length = float(length)
+        if not self.length > 0:
+            raise ValueError('every segment needs a positive length')
+        self.area = segment_function(area, 'area')
+        self.E = segment_function(E, 'E')
+        self.load = segment_function(load, 'load')
+        self.force = float(force)
+
+
+def segments_from_dicts(data):
+    segments = []
+    for index, item in enumerate(data):
+        unknown = set(item) - set(segment_fields)
+        if unknown:
+            raise ValueError('segment ' + str(index + 1) + ': unknown fields ' + ', '.join(sorted(unknown)))
+        try:
+            segments.append(segment(item['length'], item['area'], item['E'], item.get('load', 0.0), item.get('force', 0.0)))
+        except KeyError as error:
+            raise ValueError('segment ' + str(index + 1) + ' is missing ' + repr(error.args[0]))
+    if not segments:
+        raise ValueError('a bar needs at least one segment')
+    return segments
+
+
+def read_segments(path):
+    with open(path) as file:
+        data = json.load(file)
+    return segments_from_dicts(data['segments'] if isinstance(data, dict) else data)
+
+
+def element_terms(segments, owner, x0, x1):
+    # stiffness and consistent loads at the near and far node of elements [x0, x1] (local x)
+    points, weights = np.polynomial.legendre.leggauss(gauss_order)
+    h = x1 - x0
+    x = (x0 + x1)[:, None] / 2 + h[:, None] / 2 * points
+    t = (points + 1) / 2
+    EA = np.empty(x.shape)
+    q = np.empty(x.shape)
+    for index, part in enumerate(segments):
+        rows = owner == index
+        if not rows.any():
+            continue
+        xs = x[rows]
+        EA[rows] = part.area(xs, part.length) * part.E(xs, part.length) * 10**9
+        q[rows] = part.load(xs, part.length)
+    if not np.all(EA > 0) or not np.all(np.isfinite(EA)) or not np.all(np.isfinite(q)):
+        raise ValueError('A(x) and E(x) must be positive and A, E and q finite along every segment')
+    k = (EA @ weights) / (2 * h)
+    near = (q * (1 - t)) @ weights * h / 2
+    far = (q * t) @ weights * h / 2
+    return k, near, far
+
+
+def nodal_forces(segments, owner, near, far):
+    # load at the far node of every element, as fem_solver expects them; the near node load
+    # of the first element is taken straight by the wall
+    forces = far.copy()
+    forces[:-1] += near[1:]
+    last = np.append(owner[1:] != owner[:-1], True)
+    forces[last] += np.array([part.force for part in segments])[owner[last]]
+    return forces
+
+
+def error_indicators(segments, owner, x0, x1, k, near, far, carried):
+    # change in every element's stretch when it is split in two, with the force carried
+    # past its far end held fixed; linear elements converge as h^2, so halving removes
+    # about 3/4 of the error and the change is scaled by 4/3
+    mid = (x0 + x1) / 2
+    k1, near1, far1 = element_terms(segments, owner, x0, mid)
+    k2, near2, far2 = element_terms(segments, owner, mid, x1)
+    beyond = carried - far
+    coarse = carried / k
+    fine = (beyond + far2 + near2 + far1) / k1 + (beyond + far2) / k2
+    return 4 / 3 * np.abs(fine - coarse)
+
+
+def bisect(x0, x1, owner, marked):
+    # every marked element replaced by its two halves, in place along the bar
+    repeats = 1 + marked
+    first = np.cumsum(repeats) - repeats
+    mid = (x0 + x1) / 2
+    new_x0 = np.repeat(x0, repeats)
+    new_x1 = np.repeat(x1, repeats)
+    new_x1[first[marked]] = mid[marked]
+    new_x0[first[marked] + 1] = mid[marked]
+    return new_x0, new_x1, np.repeat(owner, repeats)
+
+
+class refined_bar:
+    # the final mesh and its solution; node 1 is the wall
+    def __init__(self, segments, owner, x0, x1, k, forces, wall_load, displacements, indicators, history):
+        starts = np.concatenate(([0.0], np.cumsum([part.length for part in segments])))
+        self.segment = owner
+        self.x = np.concatenate(([0.0], starts[owner] + x1))
+        self.stiffness = k
+        self.forces = forces
+        self.element_forces = element_forces(forces)
+        self.displacements = np.concatenate(([0.0], displacements))
+        self.indicators = indicators
+        self.error = float(indicators.sum())
+        self.passes = len(history)
+        self.history = history
+        self.reaction = -float(self.element_forces[0] + wall_load)
+
+    def __len__(self):
+        return len(self.stiffness)
+
+
+def refine(segments, tol, max_elements=10**6, initial=1, log=None):
+    # bisect until the summed error indicator is below tol (m), or max_elements is reached
+    owner = np.repeat(np.arange(len(segments)), initial)
+    lengths = np.array([part.length for part in segments])[owner]
+    local = np.tile(np.arange(initial), len(segments)) / initial
+    x0 = local * lengths
+    x1 = x0 + lengths / initial
+
+    history = []
+    while True:
+        k, near, far = element_terms(segments, owner, x0, x1)
+        forces = nodal_forces(segments, owner, near, far)
+        carried = element_forces(forces)
+        indicators = error_indicators(segments, owner, x0, x1, k, near, far, carried)
+        error = float(indicators.sum())
+        history.append({'elements': len(k), 'error': error})
+        if log is not None:
+            log(len(k), error)
+        if error <= tol or len(k) >= max_elements:
+            break
+
+        # Dorfler marking: the largest indicators holding mark_fraction of the total
+        order = np.argsort(indicators)[::-1]
+        count = int(np.searchsorted(np.cumsum(indicators[order]), mark_fraction * error)) + 1
+        count = min(count, max_elements - len(k))
+        marked = np.zeros(len(k), dtype=bool)
+        marked[order[:count]] = True
+        x0, x1, owner = bisect(x0, x1, owner, marked)
+
+    displacements = bar_factorization(k).solve(forces)
+    return refined_bar(segments, owner, x0, x1, k, forces, near[0], displacements, indicators, history)
+
+
+def write_refined(path, result):
+    # one row per node: node number, position along the bar and displacement
+    table = np.column_stack((np.arange(1, len(result.x) + 1), result.x, result.displacements))
+    write_table(path, table, '%d,%.17g,%.17g', 'node,x_m,displacement_m')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Solve a bar with varying section, modulus and load by adaptive refinement.')
+    parser.add_argument('segments', help='JSON file with the segments')
+    parser.add_argument('--tol', type=float, default=1e-9, help='allowed displacement error in m')
+    parser.add_argument('--max-elements', type=int, default=10**6)
+    parser.add_argument('--initial', type=int, default=1, help='elements per segment to start from')
+    parser.add_argument('--output', help='write the node positions and displacements to this CSV (or .npy) file')
+    args = parser.parse_args(argv)
+
+    try:
+        result = refine(read_segments(args.segments), args.tol, args.max_elements, args.initial)
+    except (OSError, ValueError) as error:
+        print('Failed:', error)
+        raise SystemExit(1)
+
+    converged = result.error <= args.tol
+    print(len(result), 'elements after', result.passes, 'passes, estimated error', '%.3g' % result.error, 'm' + ('' if converged else ' (not converged, max elements reached)'))
+    print('Reaction at wall', '%.6g' % result.reaction, 'N, tip displacement', '%.9g' % result.displacements[-1], 'm')
+    if args.output:
+        write_refined(args.output, result)
+    if not converged:
+        raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,412 @@
+'''
+Solver for the 1 dimensional bar model used by the FEM GUI.
+
+The bar is fixed to the wall at node 1 and element i joins nodes i and i+1 with a
+spring constant k_i = A_i * E_i / L_i. Once the wall node is cut out, the stiffness
+matrix is tridiagonal and factors exactly as
+
+    K = B^T diag(k) B
+
+where B is the lower bidiagonal matrix that turns node displacements into element
+stretches (row i: +1 at node i+1, -1 at node i). Solving K u = F is then two bidiagonal
+sweeps: B^T n = F gives the force carried by each element (the sum of the loads beyond
+it), and B u = n / k adds up the stretches from the wall outwards. Both are O(n) in time
+and memory, no matrix is ever formed and nothing is inverted.
+
+Changing one element only changes that element's stretch, so incremental_bar keeps a
+solution current through a sequence of single element edits (design iterations,
+sensitivity studies) with one suffix addition per edit instead of a full solve.
+
+Nothing in here imports tkinter or sigfig, so models can be solved from scripts and CI.
+Model files use the GUI units (area in m^2, E in GPa, length in m, force in N), either
+as CSV with an area,E,length,force header and one element per row, as JSON with one
+list per column ({"area": [...], "E": [...], "length": [...], "force": [...]}), or as a
+.npy (elements, 4) float array with the columns in that order. CSV is parsed
+chunk_rows lines at a time and .npy files are memory mapped, so models with millions of
+elements load without going through Python objects one value at a time. Results are
+written the same way in bulk, as CSV or as a .npy array of the CSV columns.
+
+Usage:
+    python fem_solver.py bar.csv                          # summary
+    python fem_solver.py bar.csv --output bar_result.csv
+    python fem_solver.py models/*.json --output-dir results --summary results.jsonl
+    python fem_solver.py bar.csv --loads load_cases.csv --output cases.csv
+    python fem_solver.py big_bar.npy --output big_result.npy
+'''
+
+import argparse
+import itertools
+import json
+import os
+import numpy as np
+
+model_columns = ('area', 'E', 'length', 'force')
+
+# dense_stiffness refuses models bigger than this, it is only meant for printing
+dense_max_nodes = 2000
+
+# files are read, checked and written this many rows at a time
+chunk_rows = 2**16
+
+# incremental_bar measures its residual after this many single element updates
+check_every = 32
+
+
+def element_stiffness(areas, moduli, lengths):
+    # k = A*E/L for every element at once, E in Pa
+    areas = np.asarray(areas, dtype=float)
+    moduli = np.asarray(moduli, dtype=float)
+    lengths = np.asarray(lengths, dtype=float)
+    if not areas.shape == moduli.shape == lengths.shape:
+        raise ValueError('area, modulus and length need one value per element')
+    return areas * moduli / lengths
+
+
+def stiffness_bands(k):
+    # diagonal and off diagonal of the cut (wall node removed) tridiagonal stiffness matrix
+    k = np.asarray(k, dtype=float)
+    diag = k.copy()
+    diag[:-1] += k[1:]
+    return diag, -k[1:]
+
+
+def stiffness_coo(k):
+    # full stiffness matrix (wall node included) as COO triplets, each element scattering its 2x2 block
+    k = np.asarray(k, dtype=float)
+    first = np.arange(len(k))
+    rows = np.concatenate((first, first, first + 1, first + 1))
+    cols = np.concatenate((first, first + 1, first, first + 1))
+    values = np.concatenate((k, -k, -k, k))
+    return rows, cols, values
+
+
+def dense_stiffness(k):
+    # the full spring matrix, built only when someone wants to look at it
+    if len(k) + 1 > dense_max_nodes:
+        raise ValueError('the dense spring matrix is only built for models up to ' + str(dense_max_nodes) + ' nodes')
+    rows, cols, values = stiffness_coo(k)
+    matrix = np.zeros((len(k) + 1, len(k) + 1))
+    np.add.at(matrix, (rows, cols), values)
+    return matrix
+
+
+def residual(k, displacements, forces):
+    # K u - F using the bands, O(n)
+    diag, off = stiffness_bands(k)
+    shape = (-1,) + (1,) * (np.ndim(displacements) - 1)
+    r = diag.reshape(shape) * displacements - forces
+    r[:-1] += off.reshape(shape) * displacements[1:]
+    r[1:] += off.reshape(shape) * displacements[:-1]
+    return r
+
+
+def backward_error(k, displacements, forces):
+    # |K u - F| / (|K| |u| + |F|) in the max norm, O(n); the displacements add up along the
+    # bar, so |r| / |F| grows with the model no matter how the solve is done, while this
+    # stays near machine precision for any stable solve
+    diag, off = stiffness_bands(k)
+    row_sums = np.abs(diag)
+    row_sums[:-1] += np.abs(off)
+    row_sums[1:] += np.abs(off)
+    r = np.abs(residual(k, displacements, forces)).max()
+    scale = row_sums.max() * np.abs(displacements).max() + np.abs(forces).max()
+    return float(r / scale) if scale > 0 else 0.0
+
+
+def element_forces(forces):
+    # force carried by each element: everything applied at or beyond its far node
+    return np.cumsum(forces[::-1], axis=0)[::-1]
+
+
+class bar_factorization:
+    # K = B^T diag(k) B for one geometry; the element flexibilities 1/k are all that needs
+    # keeping, and every load case after that is two cumulative sums
+    def __init__(self, k):
+        k = np.asarray(k, dtype=float)
+        if np.any(k <= 0):
+            raise ValueError('every element needs a positive stiffness (A*E/L)')
+        self.stiffness = k
+        self.flexibility = 1 / k
+        self.solves = 0
+
+    def __len__(self):
+        return len(self.stiffness)
+
+    def solve(self, forces):
+        # displacements of nodes 2..n+1; a 2D forces array holds one load case per column
+        # and all of them are solved together in the same two sweeps
+        forces = np.asarray(forces, dtype=float)
+        stretch = element_forces(forces) * self.flexibility.reshape((-1,) + (1,) * (forces.ndim - 1))
+        self.solves += forces.shape[1] if forces.ndim == 2 else 1
+        return np.cumsum(stretch, axis=0)
+
+
+def solve_displacements(k, forces):
+    # displacements of nodes 2..n+1 for element stiffnesses k and the loads at those nodes
+    return bar_factorization(k).solve(forces)
+
+
+def solve_batch(k, forces):
+    # displacements of nodes 2..n+1 for a batch of bars, one per column of k (elements, bars);
+    # forces is either one load case shared by every bar or one column per bar
+    k = np.asarray(k, dtype=float)
+    forces = np.asarray(forces, dtype=float)
+    if np.any(k <= 0):
+        raise ValueError('every element needs a positive stiffness (A*E/L)')
+    if forces.ndim == 1:
+        forces = forces[:, None]
+    return np.cumsum(element_forces(forces) / k, axis=0)
+
+
+class incremental_bar:
+    # keeps a solution up to date while single elements are changed one at a time
+    # changing element e's stiffness is a rank one change of K (delta_k * b_e b_e^T), and by
+    # Sherman-Morrison the solution only changes by the new stretch of element e, which every
+    # node beyond it picks up. An update is one suffix addition instead of a full solve.
+    # each update rounds the displacements it touches, so every check_every updates the
+    # backward error of the current solution is measured with the O(n) residual, and the
+    # solution is recomputed from scratch when it is above tol
+    def __init__(self, areas, moduli, lengths, forces, tol=1e-13):
+        self.areas = np.array(areas, dtype=float)
+        self.moduli = np.array(moduli, dtype=float)
+        self.lengths = np.array(lengths, dtype=float)
+        self.forces = np.array(forces, dtype=float)
+        self.tol = tol
+        self.updates = 0
+        self.refactorizations = 0
+        self.refactor()
+
+    def __len__(self):
+        return len(self.areas)
+
+    def refactor(self):
+        factorization = bar_factorization(element_stiffness(self.areas, self.moduli, self.lengths))
+        self.stiffness = factorization.stiffness
+        self.carried = element_forces(self.forces)
+        self.displacements = factorization.solve(self.forces)
+        self.refactorizations += 1
+
+    def set_forces(self, forces):
+        # a new load case on the current stiffnesses, the model itself is kept
+        self.forces = np.array(forces, dtype=float)
+        self.carried = element_forces(self.forces)
+        self.displacements = solve_displacements(self.stiffness, self.forces)
+
+    def error(self):
+        return backward_error(self.stiffness, self.displacements, self.forces)
+
+    def update(self, element, area=None, modulus=None, length=None):
+        # change one element's properties (E in Pa) and bring the displacements up to date
+        if area is not None:
+            self.areas[element] = area
+        if modulus is not None:
+            self.moduli[element] = modulus
+        if length is not None:
+            self.lengths[element] = length
+        k = self.areas[element] * self.moduli[element] / self.lengths[element]
+        if not k > 0:
+            raise ValueError('every element needs a positive stiffness (A*E/L)')
+
+        delta = self.carried[element] * (1 / k - 1 / self.stiffness[element])
+        self.stiffness[element] = k
+        self.displacements[element:] += delta
+        self.updates += 1
+
+        if self.updates % check_every == 0 and self.error() > self.tol:
+            self.refactor()
+        return self.displacements
+
+    def node_displacements(self):
+        # every node including the wall
+        return np.concatenate((np.zeros((1,) + self.forces.shape[1:]), self.displacements))
+
+
+def wall_reaction(forces):
+    return -np.sum(forces, axis=0)
+
+
+class bar_solution:
+    # displacements and element forces have one row per node / element (one column per load case for 2D loads)
+    # node 1 is the wall, so displacements[0] is always 0
+    def __init__(self, factorization, areas, forces):
+        self.factorization = factorization
+        self.stiffness = factorization.stiffness
+        self.forces = forces
+        self.element_forces = element_forces(forces)
+        self.displacements = np.concatenate((np.zeros((1,) + forces.shape[1:]), factorization.solve(forces)))
+        self.stresses = self.element_forces / areas.reshape((-1,) + (1,) * (forces.ndim - 1))
+        self.reaction = wall_reaction(forces)
+
+    def __len__(self):
+        return len(self.stiffness)
+
+
+def solve_bar(areas, moduli, lengths, forces, factorization=None):
+    # areas in m^2, moduli in Pa, lengths in m and forces in N at the far node of each element
+    # forces may be (elements, load cases), all solved against one factorization; callers that
+    # solve the same geometry again pass the factorization of the earlier solution back in
+    areas = np.asarray(areas, dtype=float)
+    forces = np.asarray(forces, dtype=float)
+    if len(forces) != len(areas):
+        raise ValueError('there must be one force per element')
+    if factorization is None:
+        factorization = bar_factorization(element_stiffness(areas, moduli, lengths))
+    return bar_solution(factorization, areas, forces)
+
+
+def read_csv(path):
+    # header names and an (rows, columns) float table, parsed one chunk of lines at a time
+    with open(path) as file:
+        header = [name.strip() for name in file.readline().split(',')]
+        chunks = []
+        while True:
+            lines = list(itertools.islice(file, chunk_rows))
+            if not lines:
+                break
+            chunks.append(np.loadtxt(lines, delimiter=',', ndmin=2))
+    table = np.concatenate(chunks) if chunks else np.zeros((0, len(header)))
+    if table.shape[1] != len(header):
+        raise ValueError(str(path) + ': rows do not match the header')
+    return header, table
+
+
+def read_model(path):
+    # columns in file units (E in GPa); a .npy model stays memory mapped
+    extension = os.path.splitext(str(path))[1].lower()
+    if extension == '.json':
+        with open(path) as file:
+            data = json.load(file)
+        model = {name: np.asarray(data[name], dtype=float) for name in model_columns}
+    elif extension == '.npy':
+        table = np.load(path, mmap_mode='r')
+        if table.ndim != 2 or table.shape[1] != len(model_columns) or table.dtype != np.float64:
+            raise ValueError(str(path) + ' needs an (elements, 4) float64 array with the columns ' + ','.join(model_columns))
+        model = {name: table[:, index] for index, name in enumerate(model_columns)}
+    else:
+        header, table = read_csv(path)
+        if sorted(header) != sorted(model_columns):
+            raise ValueError(str(path) + ' needs the columns ' + ','.join(model_columns))
+        model = {name: table[:, header.index(name)] for name in model_columns}
+
+    # checked a chunk at a time so a mapped file is never copied whole
+    bad = []
+    for start in range(0, len(model['area']), chunk_rows):
+        area, E, length, force = (model[name][start:start + chunk_rows] for name in model_columns)
+        wrong = ~np.isfinite(area * E * length * force) | (area <= 0) | (E <= 0) | (length <= 0)
+        bad.extend(start + np.flatnonzero(wrong)[:10 - len(bad)])
+        if len(bad) >= 10:
+            break
+    if bad:
+        raise ValueError(str(path) + ': elements ' + ', '.join(str(i + 1) for i in bad) + ' need a positive area, E and length and a finite force')
+    return model
+
+
+def read_loads(path):
+    # load cases as (elements, cases) with the case names from the header line
+    return read_csv(path)
+
+
+def solve_model(model, loads=None):
+    # loads, if given, replaces the model's force column with several load cases
+    forces = model['force'] if loads is None else loads
+    return solve_bar(model['area'], model['E'] * 10**9, model['length'], forces)
+
+
+def format_values(values, fmt='%.6g'):
+    # every value formatted by one string operation instead of one call per value
+    values = np.asarray(values, dtype=float).ravel()
+    if len(values) == 0:
+        return []
+    return ((fmt + '\n') * len(values) % tuple(values.tolist())).split('\n')[:-1]
+
+
+def format_rows(table, fmt):
+    # the rows of a 2D table as text, fmt being the format of one row
+    return ((fmt + '\n') * len(table)) % tuple(np.asarray(table, dtype=float).ravel().tolist())
+
+
+def write_table(path, table, fmt, header):
+    # CSV written chunk_rows rows at a time, or the bare table for a .npy path
+    if str(path).lower().endswith('.npy'):
+        np.save(path, table)
+        return
+    with open(path, 'w') as file:
+        file.write(header + '\n')
+        for start in range(0, len(table), chunk_rows):
+            file.write(format_rows(table[start:start + chunk_rows], fmt))
+
+
+def write_nodes(path, displacements, carried):
+    # one row per node: node number, displacement and the force in the element ending there
+    n = len(displacements)
+    table = np.column_stack((np.arange(1, n + 1), displacements, np.concatenate(([np.nan], carried))))
+    write_table(path, table, '%d,%.17g,%.17g', 'node,displacement_m,element_force_N')
+
+
+def write_results(path, solution, case_names=None):
+    # with several load cases there is one displacement column per case instead of the element forces
+    n = len(solution.displacements)
+    if solution.displacements.ndim == 2:
+        names = case_names or ['case' + str(i + 1) for i in range(solution.displacements.shape[1])]
+        table = np.column_stack((np.arange(1, n + 1), solution.displacements))
+        header = 'node,' + ','.join('displacement_m_' + name for name in names)
+        write_table(path, table, ','.join(['%d'] + ['%.17g'] * len(names)), header)
+        return
+    write_nodes(path, solution.displacements, solution.element_forces)
+
+
+def summary(path, solution):
+    return {
+        'model': str(path),
+        'elements': len(solution),
+        'reaction_N': np.asarray(solution.reaction).tolist(),
+        'tip_displacement_m': solution.displacements[-1].tolist(),
+        'max_abs_displacement_m': float(np.abs(solution.displacements).max()),
+        'max_abs_stress_Pa': float(np.abs(solution.stresses).max()) if len(solution) > 0 else 0.0,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Solve 1D bar models without the GUI.')
+    parser.add_argument('models', nargs='+', help='CSV, JSON or .npy model files')
+    parser.add_argument('--output', help='write the node results of a single model to this CSV (or .npy) file')
+    parser.add_argument('--output-dir', help='write <model>_result.csv for every model into this directory')
+    parser.add_argument('--summary', help='write one JSON line per model to this file')
+    parser.add_argument('--loads', help='CSV of load cases (one column per case, one row per element) solved against every model in one batch')
+    args = parser.parse_args(argv)
+    if args.output and len(args.models) > 1:
+        parser.error('--output takes a single model, use --output-dir for several')
+    if args.output_dir:
+        os.makedirs(args.output_dir, exist_ok=True)
+
+    names, loads = read_loads(args.loads) if args.loads else (None, None)
+
+    failed = 0
+    summaries = []
+    for path in args.models:
+        try:
+            solution = solve_model(read_model(path), loads)
+        except (OSError, ValueError) as error:
+            print('Failed:', error)
+            failed += 1
+            continue
+
+        result = summary(path, solution)
+        summaries.append(result)
+        print(path + ':', result['elements'], 'elements, reaction at wall', result['reaction_N'], 'N, tip displacement', result['tip_displacement_m'], 'm')
+        if args.output:
+            write_results(args.output, solution, names)
+        if args.output_dir:
+            name = os.path.splitext(os.path.basename(path))[0] + '_result.csv'
+            write_results(os.path.join(args.output_dir, name), solution, names)
+
+    if args.summary:
+        with open(args.summary, 'w') as file:
+            for result in summaries:
+                file.write(json.dumps(result) + '\n')
+    if failed:
+        raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,259 @@
+'''
+Monte Carlo / tolerance sweeps over the element values of a bar model.
+
+A sweep file perturbs the model read by fem_solver.read_model. Each column ('area', 'E',
+'length', 'force') can be given a random offset in the model file units (E in GPa), for
+every element or only for the listed element numbers (numbered from 1 like the GUI):
+
+    {
+        "seed": 0,
+        "samples": 100000,
+        "parameters": {
+            "area": {"normal": 0.0001},
+            "E": {"uniform": [-5, 5]},
+            "length": {"normal": 0.001, "elements": [1, 2]}
+        }
+    }
+
+'normal' (standard deviation) and 'uniform' (low, high) work like they do for
+orbit_ensemble.py. Draws that would make an area, E or length non-positive are drawn
+again, so those distributions are truncated at zero.
+
+Samples are drawn and solved in batches as one (elements, samples) array, sized from
+batch_budget unless --batch-size is given, and batches are spread over a process pool
+with only a few of them in flight at a time. Each batch only depends on the seed and its index, so
+the results don't depend on the number of workers. Per-node mean, std, min and max are
+merged batch by batch (Chan/Welford), and percentiles come from a uniform reservoir
+sample of whole solutions, so memory stays the same however many samples are run.
+
+Usage:
+    python fem_sweep.py bar.csv sweep.json --output stats.csv
+    python fem_sweep.py bar.csv sweep.json --samples 1000000 --workers 8 --percentiles 1 50 99
+'''
+
+import argparse
+import json
+import os
+import time
+from collections import deque
+import numpy as np
+from multiprocessing import Pool
+from fem_solver import element_stiffness, model_columns, read_model, solve_batch
+
+# at most this many displacement values are kept for the percentiles
+reservoir_budget = 10**7
+
+# a batch is sized so its (elements, samples) arrays hold about this many values in all
+batch_budget = 10**7
+
+# truncated draws give up after this many rounds of redrawing
+max_redraws = 100
+
+positive_columns = ('area', 'E', 'length')
+
+
+def sample_columns(model, parameters, rng, size):
+    # every column with the perturbations applied, (elements, size) for the perturbed ones
+    # and (elements, 1) for the rest so they broadcast without being copied
+    columns = {}
+    for name in model_columns:
+        spec = parameters.get(name)
+        if spec is None:
+            columns[name] = model[name][:, None]
+            continue
+        rows = slice(None) if 'elements' not in spec else np.asarray(spec['elements'], dtype=int) - 1
+        values = np.repeat(model[name][:, None], size, axis=1)
+        base = values[rows]
+        perturbed = base + draw(spec, rng, base.shape, name)
+        if name in positive_columns:
+            for attempt in range(max_redraws):
+                bad = perturbed <= 0
+                if not bad.any():
+                    break
+                perturbed[bad] = base[bad] + draw(spec, rng, int(bad.sum()), name)
+            else:
+                raise ValueError('the ' + name + ' perturbation keeps giving values <= 0, narrow its distribution')
+        values[rows] = perturbed
+        columns[name] = values
+    return columns
+
+
+def draw(spec, rng, shape, name):
+    if 'normal' in spec:
+        return rng.normal(0.0, spec['normal'], shape)
+    if 'uniform' in spec:
+        return rng.uniform(spec['uniform'][0], spec['uniform'][1], shape)
+    raise ValueError('unknown perturbation for ' + name)
+
+
+def solve_samples(model, parameters, seed, index, size):
+    # displacements of nodes 2..n+1 for one batch, one column per sample
+    rng = np.random.default_rng([seed, index + 1])
+    columns = sample_columns(model, parameters, rng, size)
+    areas, moduli, lengths = np.broadcast_arrays(columns['area'], columns['E'] * 10**9, columns['length'])
+    k = element_stiffness(areas, moduli, lengths)
+    return solve_batch(k, columns['force'])
+
+
+def default_batch_size(elements, parameters):
+    # samples per batch that keep the perturbed columns, the stiffnesses, the displacements
+    # and their temporaries within batch_budget values
+    arrays = len(parameters) + 4
+    return max(1, batch_budget // (max(1, elements) * arrays))
+
+
+def batch_statistics(displacements):
+    count = displacements.shape[1]
+    mean = displacements.mean(axis=1)
+    m2 = ((displacements - mean[:, None])**2).sum(axis=1)
+    return count, mean, m2, displacements.min(axis=1), displacements.max(axis=1)
+
+
+class node_statistics:
+    # running per-node statistics of the displacements; batches are merged in order
+    def __init__(self, nodes, reservoir=10000, seed=0):
+        self.nodes = nodes
+        self.count = 0
+        self.mean = np.zeros(nodes)
+        self.m2 = np.zeros(nodes)
+        self.min = np.full(nodes, np.inf)
+        self.max = np.full(nodes, -np.inf)
+        self.capacity = max(1, min(reservoir, reservoir_budget // max(1, nodes)))
+        self.reservoir = np.zeros((self.capacity, nodes))
+        self.planned = 0
+        self.rng = np.random.default_rng([seed, 0])
+
+    def plan(self, size):
+        # which samples of the next batch go into the reservoir and where (algorithm R)
+        # this only depends on how many samples came before, so it's decided before the
+        # batch is solved and only the kept columns are sent back from the workers
+        t = np.arange(self.planned + 1, self.planned + size + 1)
+        self.planned += size
+        slots = np.where(t <= self.capacity, t - 1, self.rng.integers(0, t))
+        local = np.flatnonzero(slots < self.capacity)
+        slots = slots[local]
+        # a later sample replacing the same slot wins
+        _, last = np.unique(slots[::-1], return_index=True)
+        pick = len(slots) - 1 - last
+        return local[pick], slots[pick]
+
+    def add(self, statistics, kept, slots):
+        count, mean, m2, low, high = statistics
+        total = self.count + count
+        delta = mean - self.mean
+        self.mean += delta * count / total
+        self.m2 += m2 + delta**2 * self.count * count / total
+        self.count = total
+        np.minimum(self.min, low, out=self.min)
+        np.maximum(self.max, high, out=self.max)
+        self.reservoir[slots] = kept.T
+
+    def std(self):
+        return np.sqrt(self.m2 / (self.count - 1)) if self.count > 1 else np.zeros(self.nodes)
+
+    def percentiles(self, q):
+        # (len(q), nodes) from the reservoir
+        filled = min(self.count, self.capacity)
+        return np.percentile(self.reservoir[:filled], q, axis=0)
+
+
+_sweep = None
+
+
+def set_sweep(model, parameters, seed):
+    global _sweep
+    _sweep = (model, parameters, seed)
+
+
+def run_batch(task):
+    index, size, keep = task
+    model, parameters, seed = _sweep
+    displacements = solve_samples(model, parameters, seed, index, size)
+    return batch_statistics(displacements), displacements[:, keep]
+
+
+def run_sweep(model, sweep, samples=None, workers=None, batch_size=None, reservoir=10000, log=None):
+    parameters = sweep.get('parameters', {})
+    for name in parameters:
+        if name not in model_columns:
+            raise ValueError('unknown sweep parameter ' + name + ', use ' + ', '.join(model_columns))
+    samples = samples or sweep.get('samples', 1000)
+    seed = sweep.get('seed', 0)
+    elements = len(model['area'])
+    stats = node_statistics(elements, reservoir, seed)
+    batch_size = batch_size or default_batch_size(elements, parameters)
+    batches = -(-samples // batch_size)
+    workers = workers or os.cpu_count() or 1
+
+    # the reservoir plan of a batch is made when it's submitted, in batch order, and results
+    # are merged in the same order
+    def tasks():
+        for index in range(batches):
+            size = min(batch_size, samples - index * batch_size)
+            keep, slots = stats.plan(size)
+            yield (index, size, keep), slots
+
+    def merge(slots, result):
+        statistics, kept = result
+        stats.add(statistics, kept, slots)
+        if log is not None:
+            log(stats.count, samples)
+
+    if workers > 1 and batches > 1:
+        # at most two batches per worker are queued or waiting to be merged
+        with Pool(workers, initializer=set_sweep, initargs=(model, parameters, seed)) as pool:
+            pending = deque()
+            for task, slots in tasks():
+                pending.append((slots, pool.apply_async(run_batch, (task,))))
+                if len(pending) >= 2 * workers:
+                    slots, result = pending.popleft()
+                    merge(slots, result.get())
+            while pending:
+                slots, result = pending.popleft()
+                merge(slots, result.get())
+    else:
+        set_sweep(model, parameters, seed)
+        for task, slots in tasks():
+            merge(slots, run_batch(task))
+    return stats
+
+
+def write_statistics(path, stats, q):
+    # one row per free node (node 1 is the wall and never moves)
+    percentiles = stats.percentiles(q)
+    table = np.column_stack([np.arange(2, stats.nodes + 2), stats.mean, stats.std(), stats.min, stats.max] + list(percentiles))
+    header = 'node,mean_m,std_m,min_m,max_m,' + ','.join('p' + ('%g' % value) + '_m' for value in q)
+    np.savetxt(path, table, fmt=['%d'] + ['%.10g'] * (table.shape[1] - 1), delimiter=',', header=header, comments='')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Monte Carlo sweep of a bar model with per-node displacement statistics.')
+    parser.add_argument('model', help='CSV or JSON model file (see fem_solver.py)')
+    parser.add_argument('sweep', help='JSON sweep specification')
+    parser.add_argument('--output', help='write the per-node statistics to this CSV file')
+    parser.add_argument('--samples', type=int, help='overrides the sample count in the sweep file')
+    parser.add_argument('--workers', type=int, help='processes to use (default: all cores)')
+    parser.add_argument('--batch-size', type=int, help='samples solved together in one task (default: sized from batch_budget)')
+    parser.add_argument('--reservoir', type=int, default=10000, help='solutions kept for the percentiles')
+    parser.add_argument('--percentiles', type=float, nargs='+', default=[5, 50, 95])
+    args = parser.parse_args(argv)
+
+    with open(args.sweep) as file:
+        sweep = json.load(file)
+    try:
+        model = read_model(args.model)
+        t = time.time()
+        stats = run_sweep(model, sweep, args.samples, args.workers, args.batch_size, args.reservoir)
+    except (OSError, ValueError) as error:
+        print('Failed:', error)
+        raise SystemExit(1)
+
+    print('Solved', stats.count, 'samples of', len(model['area']), 'elements in', round(time.time() - t, 3), 's')
+    percentiles = stats.percentiles(args.percentiles)
+    print('Tip displacement: mean', '%.6g' % stats.mean[-1], 'm, std', '%.6g' % stats.std()[-1], 'm, ' + ', '.join('p' + ('%g' % q) + ' ' + ('%.6g' % value) for q, value in zip(args.percentiles, percentiles[:, -1])) + ' m')
+    if args.output:
+        write_statistics(args.output, stats, args.percentiles)
+
+
+if __name__ == '__main__':
+    main()